@@ -9,6 +9,13 @@ from aspmc.util import *
 
 logger = logging.getLogger("aspmc")
 
+def _variable_sums(weights):
+    # the sums of the weights of both literals of each variable, the sum for variable `v` is at index `v - 1`
+    # cnfs hand over their weights as one array, then all the sums are computed at once
+    if isinstance(weights, np.ndarray):
+        return weights[0::2] + weights[1::2]
+    return [ weights[i] + weights[i + 1] for i in range(0, len(weights), 2) ]
+
 class Node(object):
     """A node class corresponding to nodes in a `Circuit`.
     
@@ -191,10 +198,13 @@ class Circuit(object):
             idx = 0
             for line in ddnnf:
                 line = line.strip().split()
-                mem.append(np.empty(shape, dtype = dtype))
                 if line[0] == 'L':
-                    mem[idx][:] = weights[to_pos(int(line[1]))]
-                elif line[0] == 'A':
+                    # literal nodes are never modified, so they can refer to the weight instead of copying it
+                    mem.append(weights[to_pos(int(line[1]))])
+                    idx += 1
+                    continue
+                mem.append(np.empty(shape, dtype = dtype))
+                if line[0] == 'A':
                     mem[idx][:] = one
                     for x in line[2:]:
                         mem[idx] *= mem[int(x)]
@@ -203,7 +213,8 @@ class Circuit(object):
                     for x in line[3:]:
                         mem[idx] += mem[int(x)]
                 idx += 1
-            return mem[idx - 1]
+            # the root may be a literal node, the caller must not get a reference to the weight
+            return np.array(mem[idx - 1], dtype = dtype)
 
     @staticmethod
     def live_parse_wmc(pipe, weights, zero = 0.0, one = 1.0, dtype = float):
@@ -225,10 +236,13 @@ class Circuit(object):
             line = line.decode().strip().split()
             if line[0] == 'c':
                 continue
-            mem.append(np.empty(shape, dtype = dtype))
             if line[0] == 'L':
-                mem[idx][:] = weights[to_pos(int(line[1]))]
-            elif line[0] == 'A':
+                # literal nodes are never modified, so they can refer to the weight instead of copying it
+                mem.append(weights[to_pos(int(line[1]))])
+                idx += 1
+                continue
+            mem.append(np.empty(shape, dtype = dtype))
+            if line[0] == 'A':
                 mem[idx][:] = one
                 for x in line[2:]:
                     mem[idx] *= mem[int(x)]
@@ -237,11 +251,13 @@ class Circuit(object):
                 for x in line[3:]:
                     mem[idx] += mem[int(x)]
             idx += 1
-        return mem[idx - 1]
+        # the root may be a literal node, the caller must not get a reference to the weight
+        return np.array(mem[idx - 1], dtype = dtype)
 
     @staticmethod
     def _parse_wmc_d4(path, weights, zero = 0.0, one = 1.0, dtype = float):
         shape = (np.shape(weights[0])[0], ) + np.shape(one)
+        sums = _variable_sums(weights)
         with open(path) as ddnnf:
             mem = [ None ] # the values of the nodes
             mem_type = [ False ] # whether the nodes are multiplicative
@@ -272,7 +288,7 @@ class Circuit(object):
                     idx += 1
                     var = int(line[idx])
                     while var != 0:
-                        val *= weights[to_pos(var)] + weights[neg(to_pos(var))]
+                        val *= sums[abs(var) - 1]
                         idx += 1
                         var = int(line[idx])
                     mem[int(line[0])] += val
@@ -290,6 +306,7 @@ class Circuit(object):
             lca[p[0]][p[1]] = l
 
         shape = (np.shape(weights[0])[0], ) + np.shape(one)
+        sums = _variable_sums(weights)
 
         index_to_node = { node.idx : node for node in vtree }
         index_to_node = [ index_to_node[i] for i in range(1, vtree.leaf_count()*2) ]
@@ -313,7 +330,7 @@ class Circuit(object):
                         stack.put(cur)
                         cur = cur.left
                     else:
-                        res *= weights[to_pos(cur.val)] + weights[neg(to_pos(cur.val))]
+                        res *= sums[abs(cur.val) - 1]
                         down = False
                 else:
                     last = cur
@@ -354,5 +371,5 @@ class Circuit(object):
                 mem.append(val)
                 vtree_nodes.append(vtree_node)
                 idx += 1
-            mem[idx - 1] *= factor(vtree_node, vtree.idx)
-            return mem[idx - 1]
+            # the root may be a literal node that refers to its weight, so it must not be modified in place
+            return mem[idx - 1]*factor(vtree_node, vtree.idx)
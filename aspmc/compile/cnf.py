@@ -1,38 +1,332 @@
 import subprocess
-import networkx as nx
 import tempfile
 import inspect
 import os
 import logging
-import subprocess
 import time
+import threading
 import importlib
+import hashlib
+import io
+import gc
+import functools
+import contextlib
+import atexit
+import shutil
 import numpy as np
 import psutil
-
-from aspmc.graph.hypergraph import Hypergraph
+from itertools import combinations, chain, count
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from aspmc.util import *
 
-import aspmc.compile.constrained_compile as concom
-from aspmc.compile.constrained_sdd import ConstrainedSDD
-from aspmc.compile.constrained_ddnnf import ConstrainedDDNNF
-from aspmc.compile.circuit import Circuit
-import aspmc.compile.dtree as dtree
-import aspmc.compile.vtree as vtree
-
 import aspmc.signal_handling as my_signals
 
 import aspmc.config as config
 
 src_path = os.path.abspath(os.path.realpath(inspect.getfile(inspect.currentframe())))
 src_path = os.path.realpath(os.path.join(src_path, '../../external'))
+minisat_path = os.path.join(src_path, "minisat-definitions/bin/minisat")
+uwrmaxsat_path = os.path.join(src_path, "UWrMaxSAT/uwrmaxsat/build/release/bin/uwrmaxsat")
+# files that are only handed to a solver are kept in memory if possible
+memory_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+def _tmp_dir(expected_size = 0):
+    # the directory for tempfiles of about `expected_size` bytes, None stands for the default of the tempfile module
+    # with config "tmpdir" set to "auto" the in memory file system is used as long as it has enough space left
+    tmp_dir = config.config.get("tmpdir", "auto")
+    if tmp_dir != "auto":
+        return tmp_dir if tmp_dir != "" else None
+    if memory_tmp_dir is not None and shutil.disk_usage(memory_tmp_dir).free > 2*expected_size:
+        return memory_tmp_dir
+    return None
+
+def _disk_tmp_dir():
+    # the directory for the inputs and circuits of the knowledge compilers, which write the circuit next to the cnf
+    # a circuit can be far larger than its cnf, so with config "tmpdir" set to "auto" they stay in the default directory
+    tmp_dir = config.config.get("tmpdir", "auto")
+    return tmp_dir if tmp_dir not in ("auto", "") else None
 
 logger = logging.getLogger("aspmc")
 
 class SolvingError(Exception):
     '''raise this when a solver errors'''
 
+# results of the preprocessor, keyed by a hash of its mode and input
+_preprocessing_cache = OrderedDict()
+_PREPROCESSING_CACHE_SIZE = 64
+# compiled X/D-constrained circuits, keyed by the compiler, the first quantifier and the clauses they were compiled from
+# the circuit files are kept as long as they are in the cache, which holds at most config "compilation_cache" bytes of them
+_compilation_cache = OrderedDict()
+_COMPILATION_CACHE_SIZE = 8
+
+def _cache_circuit(keys, nnf_path, v3):
+    # adds the circuit in `nnf_path` to the compilation cache under all of the `keys` and evicts the oldest circuits 
+    # until the cache fits into its limits again, returns whether the circuit is still in the cache afterwards
+    limit = int(config.config.get("compilation_cache", "0"))
+    size = os.path.getsize(nnf_path)
+    if size > limit:
+        return False
+    for key in keys:
+        _compilation_cache[key] = (nnf_path, v3, size)
+    while True:
+        sizes = { path : size for path, _, size in _compilation_cache.values() }
+        if sum(sizes.values()) <= limit and len(sizes) <= _COMPILATION_CACHE_SIZE:
+            break
+        _, (old_path, _, _) = _compilation_cache.popitem(last = False)
+        if all(path != old_path for path, _, _ in _compilation_cache.values()):
+            _kept_tempfiles.pop(old_path, None)
+            _remove_tempfiles([ old_path ])
+    return any(path == nnf_path for path, _, _ in _compilation_cache.values())
+
+# tempfiles that are reused by repeated solver calls, one per purpose, directory and thread
+_tempfile_pool = threading.local()
+# whether `_pooled_tempfile` may keep files across calls, turned off in the worker processes of `CNF.evaluate_batch`
+_pool_tempfiles = True
+# tempfiles that outlive a single solver call and the process that created them, 
+# they are removed when that process exits (a forked child inherits them but must not remove its parent's files)
+_kept_tempfiles = {}
+
+@contextlib.contextmanager
+def _pooled_tempfile(purpose, expected_size = 0):
+    # yields the same path for every call with the same purpose on the current thread as long as `expected_size` bytes 
+    # fit into the same directory, the file is emptied after each call and only removed when the process exits
+    if not _pool_tempfiles:
+        fd, path = tempfile.mkstemp(dir = _tmp_dir(expected_size))
+        os.close(fd)
+        my_signals.tempfiles.add(path)
+        try:
+            yield path
+        finally:
+            _remove_tempfiles([ path ])
+        return
+    if getattr(_tempfile_pool, "pid", None) != os.getpid():
+        # the files of a parent process must not be shared with a forked child
+        _tempfile_pool.pid = os.getpid()
+        _tempfile_pool.paths = {}
+    tmp_dir = _tmp_dir(expected_size)
+    path = _tempfile_pool.paths.get((purpose, tmp_dir))
+    if path is None:
+        fd, path = tempfile.mkstemp(dir = tmp_dir)
+        os.close(fd)
+        my_signals.tempfiles.add(path)
+        _kept_tempfiles[path] = os.getpid()
+        _tempfile_pool.paths[(purpose, tmp_dir)] = path
+    try:
+        yield path
+    finally:
+        # do not keep the contents of the last call around until the next one
+        if os.path.exists(path):
+            os.truncate(path, 0)
+
+@atexit.register
+def _remove_kept_tempfiles():
+    for path, pid in _kept_tempfiles.items():
+        if pid == os.getpid() and os.path.exists(path):
+            os.remove(path)
+
+def _init_batch_worker():
+    # runs before the first instance a worker process of `CNF.evaluate_batch` evaluates
+    # the workers are stopped without running the exit handlers, so they must not keep any tempfiles
+    global _pool_tempfiles
+    _pool_tempfiles = False
+    _tempfile_pool.__dict__.clear()
+    _kept_tempfiles.clear()
+    _compilation_cache.clear()
+
+def _remove_tempfiles(paths):
+    # removes those of the files in `paths` that are registered as tempfiles, missing ones are skipped
+    paths = my_signals.tempfiles.intersection(paths)
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    my_signals.tempfiles.difference_update(paths)
+
+def _spawn(args, **kwargs):
+    # starts an external tool without handing it any of our file descriptors (e.g. open tempfiles) 
+    # the tool runs in its own session, so that it is only stopped through `aspmc.signal_handling`, 
+    # which kills it and removes the tempfiles
+    kwargs.setdefault("close_fds", True)
+    return subprocess.Popen(args, start_new_session = True, **kwargs)
+
+def _evaluate_encoded(data, strategy, preprocessing, configuration):
+    # runs in a worker process of `CNF.evaluate_batch`, which hands over the cnf in its extended file format
+    # since the semiring modules cannot be pickled
+    if _pool_tempfiles:
+        # this is the first instance of the worker process
+        _init_batch_worker()
+    config.config.update(configuration)
+    # circuits kept by a worker would never be removed
+    config.config["compilation_cache"] = "0"
+    return CNF.from_bytes(data).evaluate(strategy = strategy, preprocessing = preprocessing)
+
+# every change to a `_WeightDict` draws a new version from here, so versions are never shared by different contents
+_weight_versions = count(1)
+
+class _WeightDict(dict):
+    # a dict of literal weights that gets a new `version` whenever an entry is assigned, added or removed, 
+    # which lets `CNF.get_weights` know when its cached list is outdated
+    version = 0
+
+    def _changed(self):
+        self.version = next(_weight_versions)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._changed()
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default = None):
+        self._changed()
+        return dict.setdefault(self, key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._changed()
+        return dict.popitem(self)
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+
+class _HashingWriter(object):
+    # forwards everything that is written to `stream` (if any) and feeds it into the hash object `digest` on the way
+    def __init__(self, stream, digest):
+        self.stream = stream
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        if self.stream is None:
+            return len(data)
+        return self.stream.write(data)
+
+def _split_special_lines(data):
+    # separates the property and header lines of an (extended) dimacs input from the clauses
+    # clause lines only consist of digits, signs and whitespace, so every 'c' or 'p' lies on a special line
+    # and the special lines can be found with str.find, which scans in C, instead of looking at every line in python
+    if isinstance(data, bytes):
+        comment, header, newline = b'c', b'p', b'\n'
+    else:
+        comment, header, newline = 'c', 'p', '\n'
+    special = []
+    pieces = []
+    start = 0
+    next_comment = data.find(comment)
+    next_header = data.find(header)
+    while next_comment != -1 or next_header != -1:
+        if next_header == -1 or (next_comment != -1 and next_comment < next_header):
+            idx = next_comment
+        else:
+            idx = next_header
+        line_start = data.rfind(newline, 0, idx) + 1
+        line_end = data.find(newline, idx)
+        if line_end == -1:
+            line_end = len(data)
+        pieces.append(data[start:line_start])
+        special.append(data[line_start:line_end])
+        start = line_end + 1
+        if next_comment != -1 and next_comment < line_end:
+            next_comment = data.find(comment, line_end)
+        if next_header != -1 and next_header < line_end:
+            next_header = data.find(header, line_end)
+    pieces.append(data[start:])
+    return special, data[:0].join(pieces)
+
+@functools.lru_cache(maxsize = None)
+def _import_semiring(name):
+    # cnfs are often loaded in batches, so we resolve each semiring module only once
+    return importlib.import_module(name)
+
+def _parse_clauses(data):
+    # numpy reads a single zero from inputs that only consist of whitespace
+    if data.isspace():
+        return []
+    # parse all the literals at once and split them into clauses at the terminating zeros
+    lits = np.fromstring(data, dtype = np.int64, sep = " ")
+    ends = np.flatnonzero(lits == 0).tolist()
+    lits = lits.tolist()
+    # creating millions of small lists triggers the cyclic garbage collector over and over, 
+    # although none of them can be part of a cycle, so we pause it while building them
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [ lits[start:end] for start, end in zip([0] + [ end + 1 for end in ends[:-1] ], ends) ]
+    finally:
+        if enabled:
+            gc.enable()
+
+def _is_trivial(clause):
+    seen = set()
+    for l in clause:
+        if -l in seen:
+            return True
+        seen.add(l)
+    return False
+
+def _mark_trivial_numpy(lits, offsets):
+    clause_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    # after sorting the literals of each clause by their variable a clause is trivial iff two neighbouring literals are complementary
+    order = np.lexsort((np.abs(lits), clause_ids))
+    lits = lits[order]
+    clause_ids = clause_ids[order]
+    clashes = (clause_ids[1:] == clause_ids[:-1]) & (lits[1:] == -lits[:-1])
+    trivial = np.zeros(len(offsets) - 1, dtype = bool)
+    trivial[clause_ids[1:][clashes]] = True
+    return trivial
+
+@functools.lru_cache(maxsize = None)
+def _numba_kernels():
+    # numba is optional and slow to import, so it is only loaded (and the kernels compiled) 
+    # the first time a cnf is large enough for them to pay off
+    # returns the pair `(mark_trivial, product_of_sums)` or None if numba is not available
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel = True, cache = True)
+    def mark_trivial(lits, offsets):
+        trivial = np.zeros(len(offsets) - 1, dtype = np.bool_)
+        for i in prange(len(offsets) - 1):
+            clause = lits[offsets[i]:offsets[i + 1]]
+            clause = clause[np.argsort(np.abs(clause))]
+            for j in range(1, len(clause)):
+                if clause[j] == -clause[j - 1]:
+                    trivial[i] = True
+                    break
+        return trivial
+
+    @njit(cache = True)
+    def product_of_sums(pos, neg):
+        # multiplies the sums row by row without materializing pos + neg
+        res = np.ones(pos.shape[1], dtype = pos.dtype)
+        for i in range(pos.shape[0]):
+            for j in range(pos.shape[1]):
+                res[j] *= pos[i, j] + neg[i, j]
+        return res
+
+    return mark_trivial, product_of_sums
+
 
 class CNF(object):
     """This class is an extended cnf class, which can be used to compile and 
@@ -65,6 +359,8 @@ class CNF(object):
 
     Args:
         path (:obj:`string`, optional): Optional parameter specifying the location of an extended cnf file to load. Defaults to None.
+        string (:obj:`string` or :obj:`bytes`, optional): Optional parameter containing an extended cnf to load. Defaults to None.
+            Must not be given together with `path`.
 
     Attributes:
         clauses (list): A list of clauses with literals in minisat format.
@@ -92,61 +388,14 @@ class CNF(object):
         self.semirings = []
         self.quantified = []
         self.transform = None
+        self._weights_cache = None
+        self._weight_arrays_cache = None
+        self._is_sat_cache = None
         if path is not None:
-            with open(path) as in_file:
-                for line in in_file:
-                    line = line.split()
-                    if len(line) == 0:
-                        continue
-                    if line[0] == 'c':
-                        if len(line) > 2 and line[1] == 'p':
-                            if line[2] == "weight":
-                                if int(line[3]) != 0:
-                                    self.weights[int(line[3])] = ' '.join(line[4:-1])
-                            elif line[2] == "semirings":
-                                self.semirings = [ importlib.import_module(mod) for mod in line[3:-1] ]
-                            elif line[2] == "transform":
-                                self.transform = ' '.join(line[3:-1])
-                            elif line[2] == "quantify":
-                                self.quantified.append([int(x) for x in line[3:-1]])
-                            elif line[2] == "auxilliary":
-                                self.auxilliary.update([int(x) for x in line[3:-1]])
-                            else:
-                                logger.error(f"Unknown property {line[2]}!")
-                            if line[-1] != '0':
-                                logger.error("Property line not ended with 0!")
-                    elif line[0] == 'p':
-                        self.nr_vars = int(line[2])
-                    else:
-                        line = [int(l) for l in line]
-                        self.clauses.append(line[:-1])
-                        
+            with open(path, 'rb') as in_file:
+                self._parse(in_file.read())
         if string is not None:
-            for line in string.split("\n"):
-                line = line.split()
-                if len(line) == 0:
-                    continue
-                if line[0] == 'c':
-                    if len(line) > 2 and line[1] == 'p':
-                        if line[2] == "weight":
-                            self.weights[int(line[3])] = ' '.join(line[4:-1])
-                        elif line[2] == "semirings":
-                            self.semirings = [ importlib.import_module(mod) for mod in line[3:-1] ]
-                        elif line[2] == "transform":
-                            self.transform = ' '.join(line[3:-1])
-                        elif line[2] == "quantify":
-                            self.quantified.append([int(x) for x in line[3:-1]])
-                        elif line[2] == "auxilliary":
-                                self.auxilliary.update([int(x) for x in line[3:-1]])
-                        else:
-                            logger.error(f"Unknown property {line[2]}!")
-                        if line[-1] != '0':
-                            logger.error("Property line not ended with 0!")
-                elif line[0] == 'p':
-                    self.nr_vars = int(line[2])
-                else:
-                    line = [int(l) for l in line]
-                    self.clauses.append(line[:-1])
+            self._parse(string)
 
         # check whether the input is reasonable
         if len(self.quantified) != len(self.semirings):
@@ -162,96 +411,223 @@ class CNF(object):
             self.quantified = [ set(range(1,self.nr_vars + 1)) ]
             import aspmc.semirings.probabilistic
             self.semirings = [ aspmc.semirings.probabilistic ]
-        for idx in self.weights:
-            if abs(idx) in self.quantified[0]:
-                self.weights[idx] = np.array([ self.semirings[0].parse(w) for w in self.weights[idx].split(";") ])
-            else:
-                self.weights[idx] = np.array([ self.semirings[1].parse(w) for w in self.weights[idx].split(";") ])
+        # the weights are stored as lists of their string values until we know over which semiring they are
+        first = set(self.quantified[0]) if len(self.quantified) > 0 else set()
+        parse_first = self.semirings[0].parse if len(self.semirings) > 0 else None
+        parse_second = self.semirings[1].parse if len(self.semirings) > 1 else None
+        if parse_second is None:
+            # with a single semiring there is nothing to decide per literal
+            for idx, values in self.weights.items():
+                self.weights[idx] = np.array([ parse_first(w) for w in values ])
+        else:
+            for idx, values in self.weights.items():
+                parse = parse_first if abs(idx) in first else parse_second
+                self.weights[idx] = np.array([ parse(w) for w in values ])
+
+    @classmethod
+    def from_path(cls, path):
+        """Loads the extended cnf file at `path`. Equivalent to `CNF(path = path)`.
+
+        Args:
+            path (:obj:`string`): The location of the extended cnf file.
+
+        Returns:
+            CNF: The loaded cnf.
+        """
+        return cls(path = path)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Loads an extended cnf from its encoded contents, e.g. the output of `to_stream()`. 
+        The contents are parsed as they are, only property lines are decoded.
+
+        Args:
+            data (:obj:`bytes`): The contents of an extended cnf file.
+
+        Returns:
+            CNF: The loaded cnf.
+        """
+        return cls(string = data)
+
+    @property
+    def weights(self):
+        return self._weights
+
+    @weights.setter
+    def weights(self, weights):
+        # the weights are kept in a `_WeightDict`, so that changes to them are noticed by the cache of `get_weights`
+        self._weights = weights if isinstance(weights, _WeightDict) else _WeightDict(weights)
 
     def __repr__(self):
         return str(self)
 
+    def _parse(self, data):
+        # data may be bytes (from a file) or a string, only the property and header lines are ever decoded
+        special_lines, clause_data = _split_special_lines(data)
+        for line in special_lines:
+            if isinstance(line, bytes):
+                line = line.decode()
+            line = line.split()
+            if line[0] == 'c':
+                if len(line) > 2 and line[1] == 'p':
+                    if line[2] == "weight":
+                        if int(line[3]) != 0:
+                            self.weights[int(line[3])] = (line[4] if len(line) == 6 else ' '.join(line[4:-1])).split(";")
+                    elif line[2] == "semirings":
+                        self.semirings = [ _import_semiring(mod) for mod in line[3:-1] ]
+                    elif line[2] == "transform":
+                        self.transform = ' '.join(line[3:-1])
+                    elif line[2] == "quantify":
+                        self.quantified.append([int(x) for x in line[3:-1]])
+                    elif line[2] == "auxilliary":
+                        self.auxilliary.update([int(x) for x in line[3:-1]])
+                    else:
+                        logger.error(f"Unknown property {line[2]}!")
+                    if line[-1] != '0':
+                        logger.error("Property line not ended with 0!")
+            elif line[0] == 'p':
+                self.nr_vars = int(line[2])
+        self.clauses.extend(_parse_clauses(clause_data))
+
     def __str__(self):
-        ret = f"p cnf {self.nr_vars} {len(self.clauses)}\n"
-        for c in self.clauses:
-            ret += f"{' '.join([str(l) for l in c])} 0\n"
-        for idx in self.weights:
-            if abs(idx) in self.quantified[0]:
-                weight = ';'.join([ self.semirings[0].to_string(w) for w in self.weights[idx] ])
-            else:
-                weight = ';'.join([ self.semirings[1].to_string(w) for w in self.weights[idx] ])
-            ret += f"c p weight {idx} {weight} 0\n"
+        # share the chunked writer of to_stream instead of formatting the cnf a second way
+        stream = io.BytesIO()
+        self.to_stream(stream, extras = True)
+        return stream.getvalue().decode()
+
+    def _write_clauses(self, stream, prefix = "", chunk_size = 8192, threaded_threshold = 100000):
+        """Write the clauses to the binary stream `stream`, one line per clause.
+
+        For large cnfs the clauses are formatted in chunks on a worker thread, 
+        so that formatting the next chunks overlaps with writing the current one.
+
+        Args:
+            stream (stream): The stream the clauses should be written to. Must accept binary encoding.
+            prefix (:obj:`string`, optional): A string that is written in front of every clause. Defaults to `""`.
+            chunk_size (:obj:`int`, optional): The number of clauses that are formatted at once. Defaults to `8192`.
+            threaded_threshold (:obj:`int`, optional): The number of clauses above which a worker thread is used. Defaults to `100000`.
+
+        Returns:
+            None
+        """
+        def format_chunk(start):
+            return format_clauses(self.clauses[start:start + chunk_size], prefix.encode())
+        starts = range(0, len(self.clauses), chunk_size)
+        if len(self.clauses) <= threaded_threshold:
+            for start in starts:
+                stream.write(format_chunk(start))
+            return
+        with ThreadPoolExecutor(max_workers = 1) as executor:
+            # keep only a few formatted chunks in flight to bound the memory usage
+            pending = deque()
+            for start in starts:
+                pending.append(executor.submit(format_chunk, start))
+                if len(pending) > 2:
+                    stream.write(pending.popleft().result())
+            while len(pending) > 0:
+                stream.write(pending.popleft().result())
+
+    def _extra_lines(self):
+        lines = []
+        if len(self.weights) > 0:
+            first = set(self.quantified[0])
+            to_string_first = self.semirings[0].to_string
+            to_string_second = self.semirings[1].to_string if len(self.semirings) > 1 else None
+            for idx, values in self.weights.items():
+                weight = ';'.join(map(to_string_first if abs(idx) in first else to_string_second, values))
+                lines.append(f"c p weight {idx} {weight} 0")
         if len(self.semirings) > 0:
-            ret += f"c p semirings {' '.join([ x.__name__ for x in self.semirings])} 0\n"
+            lines.append(f"c p semirings {' '.join([ x.__name__ for x in self.semirings])} 0")
         if self.transform is not None:
-            ret += f"c p transform {self.transform} 0\n"
+            lines.append(f"c p transform {self.transform} 0")
         for l in self.quantified:
-            ret += f"c p quantify {' '.join([str(x) for x in l])} 0\n"
-        ret += f"c p auxilliary {' '.join([str(x) for x in self.auxilliary])} 0\n"
-        return ret
+            lines.append(f"c p quantify {' '.join(map(str, l))} 0")
+        lines.append(f"c p auxilliary {' '.join(map(str, self.auxilliary))} 0")
+        return lines
 
     def write_kc_cnf(self, out_file):
         out_file.write(f"p cnf {self.nr_vars} {len(self.clauses)}\n".encode())
-        for c in self.clauses:
-            out_file.write(f"{' '.join([str(l) for l in c])} 0\n".encode())
+        self._write_clauses(out_file)
+        lines = []
         for idx in range(1, self.nr_vars + 1):
             if idx not in self.auxilliary:
-                out_file.write(f"c p weight {idx} {idx} 0\n".encode())
-                out_file.write(f"c p weight {-idx} {-idx} 0\n".encode())
+                lines.append(f"c p weight {idx} {idx} 0")
+                lines.append(f"c p weight {-idx} {-idx} 0")
+        out_file.write("".join(line + "\n" for line in lines).encode())
+
+    def _maxplus_weights(self):
+        """Converts the weights of the literals into maxplus weights for the reduction to MaxSAT.
 
-    def write_maxsat_cnf(self, out_file):
-        import math
-        real_weights = { l : w[0].value for l,w in self.weights.items() }
+        Returns:
+            (:obj:`np.array`, :obj:`np.array`, :obj:`np.array`): 
+            
+            The maxplus weights of the positive literals. `pos[v]` is the weight of `v`, 
+            or `NaN` if `v` has no weight, is irrelevant or occurs in a hard constraint.
+
+            The maxplus weights of the negative literals in the same format.
+
+            The literals with weight `-inf`, whose negations must hold in every solution.
+        """
+        lits = np.fromiter(self.weights.keys(), dtype = int, count = len(self.weights))
+        values = np.fromiter((w[0].value for w in self.weights.values()), dtype = float, count = len(self.weights))
         if self.semirings[0].__name__ == "aspmc.semirings.maxtimes":
             # we first need to convert into maxplus weights
-            real_weights = { l : math.log(w) if w > 0 else float("-inf") for l,w in real_weights.items() }
+            with np.errstate(divide = "ignore"):
+                values = np.where(values > 0, np.log(np.maximum(values, 0)), float("-inf"))
         elif self.semirings[0].__name__ == "aspmc.semirings.minplus":
             # we first need to convert into maxplus weights
-            real_weights = { l : -w if w != float("inf") else float("-inf") for l,w in real_weights.items() }
+            values = -values
         elif self.semirings[0].__name__ != "aspmc.semirings.maxplus":
             logger.error(f"MaxSAT evaluation is currently not supported for semiring {self.semirings[0].__name__}")
             exit(-1)
+        # store the weights of v and -v at index v, NaN means that there is no weight
+        pos = np.full(self.nr_vars + 1, np.nan)
+        neg = np.full(self.nr_vars + 1, np.nan)
+        pos[lits[lits > 0]] = values[lits > 0]
+        neg[-lits[lits < 0]] = values[lits < 0]
         # sort out variables that are irrelevant
-        real_weights = { l : w for l,w in real_weights.items() if w != real_weights[-l]}
+        irrelevant = pos == neg
+        pos[irrelevant] = np.nan
+        neg[irrelevant] = np.nan
         # handle hard constraints from literals with weight -inf and keep the rest
-        negated_units = [ l for l,w in real_weights.items() if w == float('-inf')]
-        real_weights = { l : w for l,w in real_weights.items() if w != float('-inf')}
+        pos_units = pos == float("-inf")
+        neg_units = neg == float("-inf")
+        negated_units = np.concatenate((np.flatnonzero(pos_units), -np.flatnonzero(neg_units)))
+        pos[pos_units] = np.nan
+        neg[neg_units] = np.nan
+        return pos, neg, negated_units
+
+    def write_maxsat_cnf(self, out_file, maxplus_weights = None):
+        # callers that already converted the weights can pass the result of _maxplus_weights() to avoid redoing it
+        if maxplus_weights is None:
+            maxplus_weights = self._maxplus_weights()
+        pos, neg, negated_units = maxplus_weights
         # make sure every variable has exactly one weight and that weight is greater than 0
-        for i in range(1, self.nr_vars + 1):
-            if i in real_weights:
-                if -i in real_weights:
-                    if real_weights[i] < real_weights[-i]:
-                        real_weights[-i] -= real_weights[i]
-                        del real_weights[i]
-                    else:
-                        real_weights[i] -= real_weights[-i]
-                        del real_weights[-i]
-                else:
-                    if real_weights[i] < 0:
-                        real_weights[-i] = -real_weights[i]
-                        del real_weights[i]
-            else:
-                if -i in real_weights:
-                    if real_weights[-i] < 0:
-                        real_weights[i] = -real_weights[-i]
-                        del real_weights[-i]
-        max_exp = max([ math.ceil(-math.log10(w)) for w in real_weights.values() if w > 0 ] + [0])
-        real_weights = { l : math.floor(w*10**(8 + max_exp)) for l,w in real_weights.items() if abs(w) >= 0.1**(8 + max_exp) }
-        gcd = 0
-        for w in real_weights.values():
-            gcd = math.gcd(w, gcd)
-        real_weights = { l : w//gcd for l,w in real_weights.items() }
-        top = sum(real_weights.values()) + 2
+        diff = np.where(np.isnan(pos), 0.0, pos) - np.where(np.isnan(neg), 0.0, neg)
+        variables = np.arange(self.nr_vars + 1)
+        soft_lits = np.where(diff >= 0, variables, -variables)
+        diff = np.abs(diff)
+        max_exp = int(np.max(np.ceil(-np.log10(diff[diff > 0])), initial = 0))
+        keep = diff >= 0.1**(8 + max_exp)
+        soft_lits = soft_lits[keep]
+        soft_weights = np.floor(diff[keep]*10**(8 + max_exp))
+        if len(soft_weights) > 0 and soft_weights.max() >= 2**63:
+            # too large for fixed width integers, fall back to python integers
+            soft_weights = np.array([ int(w) for w in soft_weights ], dtype = object)
+        else:
+            soft_weights = soft_weights.astype(np.int64)
+        gcd = np.gcd.reduce(soft_weights)
+        if gcd > 0:
+            soft_weights //= gcd
+        top = sum(soft_weights.tolist()) + 2
         if top >= 2**63:
             logger.error(f"Cannot reduce this instance to a maxsat instance.")
             exit(-1)
-        out_file.write(f"p wcnf {self.nr_vars} {len(self.clauses) + len(real_weights)} {top}\n".encode())
-        for c in self.clauses:
-            out_file.write(f"{top} {' '.join([str(l) for l in c])} 0\n".encode())
-        for l in negated_units:
-            out_file.write(f"{top} {-l} 0\n".encode())
-        for l, w in real_weights.items():
-            out_file.write(f"{w} {l} 0\n".encode())
+        out_file.write(f"p wcnf {self.nr_vars} {len(self.clauses) + len(soft_lits)} {top}\n".encode())
+        self._write_clauses(out_file, prefix = f"{top} ")
+        hard = format_clauses([ (-l, ) for l in negated_units.tolist() ], prefix = b"%d " % top)
+        soft = format_clauses(zip(soft_weights.tolist(), soft_lits.tolist()))
+        out_file.write(hard + soft)
 
         #c = CNF()
         #c.clauses = self.clauses
@@ -276,23 +652,21 @@ class CNF(object):
         Returns:
             list: The list of variables that are defined by the inputs `P` w.r.t. the cnf.
         """
-        (cnf_fd, cnf_tmp) = tempfile.mkstemp()
-        my_signals.tempfiles.add(cnf_tmp)
-        (input_fd, input_tmp) = tempfile.mkstemp()
-        my_signals.tempfiles.add(input_tmp)
-        with os.fdopen(cnf_fd, 'wb') as cnf_file:
-            self.to_stream(cnf_file)
-        with os.fdopen(input_fd, 'w') as input_file:
-            input_file.write(" ".join([str(p) for p in list(P) + [0]]))
-        p = subprocess.Popen(["timeout",  timeout, os.path.join(src_path, "minisat-definitions/bin/defined"), cnf_tmp, input_tmp], stdout=subprocess.PIPE)
-        p.wait()
-        ret = p.stdout.read().decode().split(' ')[:-1]
-        ret = [ int(v) for v in ret ]
-        p.stdout.close()
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.remove(cnf_tmp)
-        os.remove(input_tmp)
-        my_signals.tempfiles.remove(input_tmp)
+        with _pooled_tempfile("definitions", self._file_size()) as cnf_tmp, _pooled_tempfile("definition inputs") as input_tmp:
+            with open(cnf_tmp, 'wb') as cnf_file:
+                self.to_stream(cnf_file)
+            with open(input_tmp, 'wb') as input_file:
+                buf = bytearray()
+                for v in P:
+                    buf += b"%d " % v
+                    if len(buf) > 1<<16:
+                        input_file.write(buf)
+                        buf.clear()
+                buf += b"0"
+                input_file.write(buf)
+            p = _spawn(["timeout",  timeout, os.path.join(src_path, "minisat-definitions/bin/defined"), cnf_tmp, input_tmp], stdout=subprocess.PIPE)
+            output, _ = p.communicate()
+        ret = [ int(v) for v in output.split(b' ')[:-1] ]
         return ret
         
     def is_sat(self):
@@ -301,20 +675,32 @@ class CNF(object):
         Returns:
             bool: `True` if the cnf is satisfiable, `False` otherwise.
         """
-        p = subprocess.Popen([os.path.join(src_path, "minisat-definitions/bin/minisat")], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        p.stdin.write(str(self).encode())
-        p.stdin.close()
-        p.wait()
-        for line in p.stdout.read().decode().split('\n'):
-            line = line.split()
-            if len(line) == 0:
-                continue
-            if line[0] == 'UNSATISFIABLE':
-                p.stdout.close()
-                return False
-            elif line[0] == 'SATISFIABLE':
-                p.stdout.close()
-                return True
+        if any(len(c) == 0 for c in self.clauses):
+            # an empty clause can not be satisfied, no need to call minisat
+            return False
+        # the result is cached for the cnf that is handed to minisat, 
+        # so that any change to the clauses (also in place) leads to a new call
+        stream = io.BytesIO()
+        self.to_stream(stream)
+        data = stream.getvalue()
+        key = hashlib.blake2b(data, digest_size = 16).digest()
+        if self._is_sat_cache is not None and self._is_sat_cache[0] == key:
+            return self._is_sat_cache[1]
+        p = _spawn([minisat_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1<<20)
+        result = None
+        with p:
+            p.stdin.write(data)
+            p.stdin.close()
+            for line in p.stdout:
+                if line.startswith(b'UNSATISFIABLE'):
+                    result = False
+                    break
+                elif line.startswith(b'SATISFIABLE'):
+                    result = True
+                    break
+        if result is not None:
+            self._is_sat_cache = (key, result)
+        return result
 
     def to_file(self, path, extras = False):
         """Write the cnf to the file with the name `path`.
@@ -326,25 +712,8 @@ class CNF(object):
         Returns:
             None
         """
-        with open(path, mode = 'w') as file_out:
-            file_out.write(f"p cnf {self.nr_vars} {len(self.clauses)}\n")
-            for c in self.clauses:
-                file_out.write(f"{' '.join([str(l) for l in c])} 0\n")
-            if extras:
-                for idx in self.weights:
-                    if abs(idx) in self.quantified[0]:
-                        weight = ';'.join([ self.semirings[0].to_string(w) for w in self.weights[idx] ])
-                    else:
-                        weight = ';'.join([ self.semirings[1].to_string(w) for w in self.weights[idx] ])
-                    file_out.write(f"c p weight {idx} {weight} 0\n")
-                if len(self.semirings) > 0:
-                    file_out.write(f"c p semirings {' '.join([ x.__name__ for x in self.semirings])} 0\n")
-                if self.transform is not None:
-                    file_out.write(f"c p transform {self.transform} 0\n")
-                for l in self.quantified:
-                    file_out.write(f"c p quantify {' '.join([str(x) for x in l])} 0\n")
-                file_out.write(f"c p auxilliary {' '.join([str(x) for x in self.auxilliary])} 0\n")
-            
+        with open(path, mode = 'wb') as file_out:
+            self.to_stream(file_out, extras = extras)
 
     def to_stream(self, stream, extras = False):
         """Write the cnf to the stream `stream`.
@@ -357,22 +726,9 @@ class CNF(object):
             None
         """            
         stream.write(f"p cnf {self.nr_vars} {len(self.clauses)}\n".encode())
-        for c in self.clauses:
-            stream.write(f"{' '.join([str(l) for l in c])} 0\n".encode())
+        self._write_clauses(stream)
         if extras:
-            for idx in self.weights:
-                if abs(idx) in self.quantified[0]:
-                    weight = ';'.join([ self.semirings[0].to_string(w) for w in self.weights[idx] ])
-                else:
-                    weight = ';'.join([ self.semirings[1].to_string(w) for w in self.weights[idx] ])
-                stream.write(f"c p weight {idx} {weight} 0\n".encode())
-            if len(self.semirings) > 0:
-                stream.write(f"c p semirings {' '.join([ x.__name__ for x in self.semirings])} 0\n".encode())
-            if self.transform is not None:
-                stream.write(f"c p transform {self.transform} 0\n".encode())
-            for l in self.quantified:
-                stream.write(f"c p quantify {' '.join([str(x) for x in l])} 0\n".encode())
-            stream.write(f"c p auxilliary {' '.join([str(x) for x in self.auxilliary])} 0\n".encode())
+            stream.write("".join(line + "\n" for line in self._extra_lines()).encode())
 
     def primal_graph(self):
         """Construct the an `nx.Graph` that corresponds to the primal graph of the cnf.
@@ -380,10 +736,12 @@ class CNF(object):
         Returns:
             nx.Graph: The primal graph of the cnf. 
         """
+        import networkx as nx
         graph = nx.Graph()
         graph.add_nodes_from(range(1, self.nr_vars+1))
-        for c in self.clauses:
-            graph.add_edges_from(sum([[(abs(l),abs(lp)) for l in c if abs(l) != abs(lp)] for lp in c], []))
+        # clauses often share variable pairs, so we deduplicate the edges before handing them to networkx in one go
+        edges = dict.fromkeys(chain.from_iterable(combinations(sorted({ abs(l) for l in c }), 2) for c in self.clauses))
+        graph.add_edges_from(edges)
         return graph
 
     def primal_hypergraph(self):        
@@ -392,52 +750,207 @@ class CNF(object):
         Returns:
             aspmc.graph.Hypergraph: The primal hypergraph of the cnf. 
         """
+        from aspmc.graph.hypergraph import Hypergraph
         graph = Hypergraph()
         graph.add_nodes_from(range(1, self.nr_vars+1))
         for c in self.clauses:
-            graph.add_edge([ abs(l) for l in c ])
+            graph.add_edge(list({ abs(l) for l in c }))
         return graph
 
     def get_weights(self):
         """Get some relevant information about the weights of the cnf in a convenient format.
 
         Returns:
-            (list, object, object, type): 
+            (:obj:`np.array`, object, object, type): 
             
             The weights of the literals. `weights[2*(i-1)]` is the weight of `i` and `weights[2*(i-1) + 1]` is the weight of `-i`.
+            If all the weights belong to the same semiring they are stored in one contiguous array of shape `(2*nr_vars, ...)`, 
+            otherwise (i.e. for 2AMC instances) `weights` is a list of arrays.
             
             The zero of the (outermost) AMC instance.
             
             The one of the (outermost) AMC instance.
             
             The type of the weights that should be used for numpy arrays.
+
+            The list of weights is cached and only rebuilt if the number of variables, the semirings or the weights change, 
+            where a weight changes when it is assigned, added or removed. Arrays of weights that are modified in place are not noticed.
         """
+        key = (self.nr_vars, self.weights.version, tuple(id(s) for s in self.semirings))
+        if self._weights_cache is None or self._weights_cache[0] != key:
+            if len(self.semirings) == 0:
+                weights = np.ones((self.nr_vars*2, 1), dtype = object)
+            else:
+                weights = [ self.weights[l] for l in to_dimacs_array(len(self.weights)).tolist() ]
+                if len(self.semirings) == 1 and len(weights) > 0:
+                    weights = np.stack(weights)
+            self._weights_cache = (key, weights)
+        weights = self._weights_cache[1]
+        if isinstance(weights, list):
+            # the constrained circuits replace entries of the list, which must not leak into the cache
+            weights = list(weights)
         if len(self.semirings) == 0:
-            weights = [ np.array([ 1 ], dtype = object) for _ in range(self.nr_vars*2) ]
             zero = 0
             one = 1
             dtype = object
-        elif len(self.semirings) >= 1:
-            weights = []
-            for i in range(len(self.weights)):
-                weights.append(self.weights[to_dimacs(i)])
+        else:
             zero = self.semirings[0].zero()
             one = self.semirings[0].one()
             dtype = self.semirings[0].dtype
         return (weights, zero, one, dtype)
 
+    def get_weight_arrays(self, variables = None):
+        """Get the weights of the literals of the given variables as two dense arrays.
+
+        Args:
+            variables (iterable, optional): The variables whose weights should be returned. 
+                All of them must be quantified over the same semiring. Must not be empty.
+                Defaults to all variables `1, ..., nr_vars`. In this case the result is cached alongside the result of `get_weights()`.
+
+        Returns:
+            (:obj:`np.array`, :obj:`np.array`): 
+            
+            The weights of the positive literals. `pos[i]` is the weight of the `i`-th variable.
+
+            The weights of the negative literals. `neg[i]` is the weight of the negation of the `i`-th variable.
+        """
+        weights, _, _, _ = self.get_weights()
+        if isinstance(weights, np.ndarray):
+            if variables is None:
+                return weights[0::2], weights[1::2]
+            positions = to_pos_array(np.fromiter(variables, dtype = int))
+            return weights[positions], weights[positions + 1]
+        if variables is None:
+            key = self._weights_cache[0]
+            if self._weight_arrays_cache is None or self._weight_arrays_cache[0] != key:
+                pos = np.stack(weights[0::2])
+                neg = np.stack(weights[1::2])
+                self._weight_arrays_cache = (key, pos, neg)
+            return self._weight_arrays_cache[1:]
+        positions = to_pos_array(np.fromiter(variables, dtype = int)).tolist()
+        pos = np.stack([ weights[p] for p in positions ])
+        neg = np.stack([ weights[p + 1] for p in positions ])
+        return pos, neg
+
+    def get_non_contributing_vars(self, variables):
+        """Determines the variables in `variables` whose literals both have weight one over the (outermost) semiring.
+        Such variables do not contribute to the evaluation result and may be projected away.
+
+        Args:
+            variables (iterable): The variables that should be checked.
+
+        Returns:
+            list: The variables in `variables` that do not contribute.
+        """
+        variables = np.fromiter(variables, dtype = int)
+        if len(variables) == 0:
+            return []
+        one = self.semirings[0].one()
+        pos, neg = self.get_weight_arrays(variables)
+        mask = ((pos == one) & (neg == one)).reshape(len(variables), -1).all(axis = 1)
+        return variables[mask].tolist()
+
+    def clause_arrays(self):
+        """Get the clauses of the cnf in a compressed sparse row layout.
+
+        Returns:
+            (:obj:`np.array`, :obj:`np.array`): 
+
+            The literals of all the clauses one after another as an `np.int32` array.
+
+            The offsets of the clauses as an `np.int64` array of length `len(self.clauses) + 1`.
+            The literals of the `i`-th clause are `lits[offsets[i]:offsets[i+1]]`.
+        """
+        offsets = np.zeros(len(self.clauses) + 1, dtype = np.int64)
+        np.cumsum(np.fromiter(map(len, self.clauses), dtype = np.int64, count = len(self.clauses)), out = offsets[1:])
+        lits = np.fromiter(chain.from_iterable(self.clauses), dtype = np.int32, count = offsets[-1])
+        return lits, offsets
+
     def remove_trivial_clauses(self):
         """Removes all the trivial clauses from the cnf. Trivial clauses are those clauses that contain both `v` and `-v` for some variables `v`.
 
         Returns:
             None
         """
-        new_clauses = []
+        if len(self.clauses) == 0:
+            return
+        if len(self.clauses) < 1000:
+            # for small cnfs a single scan with a set per clause is cheaper than setting up the arrays
+            clauses = [ c for c in self.clauses if not _is_trivial(c) ]
+            if len(clauses) < len(self.clauses):
+                self.clauses = clauses
+            return
+        lits, offsets = self.clause_arrays()
+        # compiling the numba kernel only pays off for large cnfs
+        kernels = _numba_kernels() if len(lits) > 100000 else None
+        if kernels is not None:
+            trivial = kernels[0](lits, offsets)
+        else:
+            trivial = _mark_trivial_numpy(lits, offsets)
+        if trivial.any():
+            self.clauses = [ c for c, t in zip(self.clauses, trivial.tolist()) if not t ]
+
+    def remove_duplicate_clauses(self):
+        """Removes all the clauses from the cnf that contain the same literals as an earlier clause.
+
+        Returns:
+            None
+        """
+        seen = set()
+        clauses = []
         for c in self.clauses:
-            if not any([ any([ c[i] == -c[j] for j in range(i+1, len(c)) ]) for i in range(len(c)) ]):
-                new_clauses.append(c)
-        self.clauses = new_clauses
+            key = frozenset(c)
+            if key not in seen:
+                seen.add(key)
+                clauses.append(c)
+        if len(clauses) < len(self.clauses):
+            self.clauses = clauses
+
+    def _multiply_sums(self, res, variables = None):
+        """Multiplies `res` in place with the product of `w(v) + w(-v)` over the variables `v` in `variables`.
+
+        Args:
+            res (:obj:`np.array`): The array to multiply into.
+            variables (iterable, optional): The variables whose sums of literal weights should be multiplied. 
+                Defaults to all variables `1, ..., nr_vars`.
 
+        Returns:
+            :obj:`np.array`: The array `res`.
+        """
+        if variables is not None:
+            variables = np.fromiter(variables, dtype = int)
+        if (self.nr_vars if variables is None else len(variables)) > 0:
+            pos, neg = self.get_weight_arrays(variables)
+            # the kernel only works for numeric weights and compiling it only pays off for many variables
+            kernels = _numba_kernels() if pos.dtype == np.float64 and len(pos) > 100000 else None
+            if kernels is not None:
+                res *= kernels[1](pos.reshape(len(pos), -1), neg.reshape(len(neg), -1)).reshape(pos.shape[1:])
+            else:
+                res *= np.multiply.reduce(pos + neg, axis = 0)
+        return res
+
+    def _multiply_assignment(self, res, solution):
+        """Multiplies `res` in place with the product of the weights of the literals in `solution`.
+
+        Args:
+            res (:obj:`np.array`): The array to multiply into.
+            solution (iterable): The literals whose weights should be multiplied. Contains at most one literal per variable.
+
+        Returns:
+            :obj:`np.array`: The array `res`.
+        """
+        lits = np.asarray(solution, dtype = int) if isinstance(solution, np.ndarray) else np.fromiter(solution, dtype = int)
+        if len(lits) > 0:
+            weights, _, _, _ = self.get_weights()
+            if isinstance(weights, np.ndarray):
+                # the weights are in one array, so a single gather picks the weight of every literal
+                res *= np.multiply.reduce(weights[to_pos_array(lits)], axis = 0)
+                return res
+            pos, neg = self.get_weight_arrays()
+            variables = np.abs(lits) - 1
+            positive = (lits > 0).reshape((-1, ) + (1, )*(pos.ndim - 1))
+            res *= np.multiply.reduce(np.where(positive, pos[variables], neg[variables]), axis = 0)
+        return res
 
     def evaluate_trivial(self):
         """Checks if this is a trivial instance and if so returns its value. Before the check all the trivial clauses are removed.
@@ -449,7 +962,8 @@ class CNF(object):
         Returns:
             object: The value of the AMC instance if it is trivial and `None` otherwise.
         """
-        self.remove_trivial_clauses()
+        if len(self.clauses) > 0:
+            self.remove_trivial_clauses()
         if len(self.semirings) == 0:
             if len(self.clauses) == 0:
                 if self.nr_vars == 0:
@@ -459,9 +973,7 @@ class CNF(object):
                     first_shape = (np.shape(weights[0])[0], ) + np.shape(one)
                     res = np.empty(first_shape, dtype=dtype)
                     res[:] = one
-                    for i in range(self.nr_vars):
-                        res *= weights[to_pos(i)] + weights[neg(to_pos(i))]
-                    return res
+                    return self._multiply_sums(res)
             elif not self.is_sat():
                 return [ 0 ]
         elif len(self.semirings) == 1:
@@ -473,9 +985,7 @@ class CNF(object):
                     first_shape = (np.shape(weights[0])[0], ) + np.shape(one)
                     res = np.empty(first_shape, dtype=dtype)
                     res[:] = one
-                    for i in range(self.nr_vars):
-                        res *= weights[to_pos(i)] + weights[neg(to_pos(i))]
-                    return res
+                    return self._multiply_sums(res)
             elif not self.is_sat():        
                 weights, zero, one, dtype = self.get_weights()
                 first_shape = (np.shape(weights[0])[0], ) + np.shape(one)
@@ -491,19 +1001,18 @@ class CNF(object):
                     second_shape = (np.shape(weights[0])[0], ) + np.shape(self.semirings[1].one())
                     res = np.empty(second_shape, dtype=self.semirings[1].dtype)
                     res[:] = self.semirings[1].one()
-                    first = set(self.quantified[0])
-                    second = set(range(1, self.nr_vars + 1))
-                    second.difference_update(first)
-                    for i in second:
-                        res *= weights[to_pos(i)] + weights[neg(to_pos(i))]
+                    is_first = np.zeros(self.nr_vars + 1, dtype = bool)
+                    is_first[np.fromiter(self.quantified[0], dtype = int)] = True
+                    first = np.flatnonzero(is_first)
+                    second = np.flatnonzero(~is_first[1:]) + 1
+                    res = self._multiply_sums(res, second)
                     f_transform = eval(self.transform)
                     transform = lambda x : self.semirings[0].from_value(f_transform(x))
                     res = np.array([ transform(w) for w in res ], dtype = self.semirings[0].dtype)
-                    for i in first:
-                        res *= weights[to_pos(i)] + weights[neg(to_pos(i))]
-                    return res
+                    return self._multiply_sums(res, first)
             elif not self.is_sat():
-                first_shape = (np.shape(self.weights[0])[0], ) + np.shape(self.semirings[0].one())
+                weights, _, _, _ = self.get_weights()
+                first_shape = (np.shape(weights[0])[0], ) + np.shape(self.semirings[0].one())
                 res = np.empty(first_shape, dtype=self.semirings[0].dtype)
                 res[:] = self.semirings[0].zero()
                 return res
@@ -548,27 +1057,54 @@ class CNF(object):
         logger.debug("Knowledge compiler output:")
         if knowledge_compiler == "c2d":
             if os.path.isfile(f"{file_name}.exist"):
-                p = subprocess.Popen([os.path.join(src_path, "c2d/bin/c2d_linux"), "-reduce", "-in", file_name, "-dt_in", file_name + ".dtree", "-cache_size", str(available_memory), "-exist", file_name + ".exist"], stdout=subprocess.PIPE)
+                p = _spawn([os.path.join(src_path, "c2d/bin/c2d_linux"), "-reduce", "-in", file_name, "-dt_in", file_name + ".dtree", "-cache_size", str(available_memory), "-exist", file_name + ".exist"], stdout=subprocess.PIPE)
             else:
-                p = subprocess.Popen([os.path.join(src_path, "c2d/bin/c2d_linux"), "-smooth_all", "-reduce", "-in", file_name, "-dt_in", file_name + ".dtree", "-cache_size", str(available_memory)], stdout=subprocess.PIPE)
+                p = _spawn([os.path.join(src_path, "c2d/bin/c2d_linux"), "-smooth_all", "-reduce", "-in", file_name, "-dt_in", file_name + ".dtree", "-cache_size", str(available_memory)], stdout=subprocess.PIPE)
         elif knowledge_compiler == "miniC2D":            
-            p = subprocess.Popen([os.path.join(src_path, "miniC2D/bin/linux/miniC2D"), "-c", file_name, "-v", file_name + ".vtree", "-s" , str(available_memory)], stdout=subprocess.PIPE)
+            p = _spawn([os.path.join(src_path, "miniC2D/bin/linux/miniC2D"), "-c", file_name, "-v", file_name + ".vtree", "-s" , str(available_memory)], stdout=subprocess.PIPE)
         elif knowledge_compiler == "sharpsat-td":
             decot = float(config.config["decot"])
             decot = max(decot, 0.1)
-            p = subprocess.Popen(["./sharpSAT", "-dDNNF", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), file_name, "-dDNNF_out", file_name + ".nnf"], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
+            p = _spawn(["./sharpSAT", "-dDNNF", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), file_name, "-dDNNF_out", file_name + ".nnf"], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
         elif knowledge_compiler == "d4":
-            p = subprocess.Popen([os.path.join(src_path, "d4/d4_static"), file_name, "-dDNNF", f"-out={file_name}.nnf", "-smooth"], stdout=subprocess.PIPE)
+            p = _spawn([os.path.join(src_path, "d4/d4_static"), file_name, "-dDNNF", f"-out={file_name}.nnf", "-smooth"], stdout=subprocess.PIPE)
         
-        for line in iter(p.stdout.readline, b''):
-            line = line.decode()
-            logger.debug(line[:-1])
-        p.wait()
-        p.stdout.close()
+        # only decode the output if it is actually logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        with p:
+            for line in p.stdout:
+                if debug:
+                    logger.debug(line[:-1].decode())
 
         if p.returncode != 0:
             logger.error(f"Knowledge compilation failed with exit code {p.returncode}.")
-            exit(-1) 
+            exit(-1)
+
+    @staticmethod
+    def compile_many(file_names, knowledge_compiler = "c2d", max_workers = None):
+        """Compiles several CNFs into tractable circuits in parallel. The output circuits are in the files `file_name + ".nnf"`.
+
+        Each CNF must be prepared as described in `CNF.compile_single()`.
+        The work is done by the external knowledge compilers, so a thread per running compiler suffices to keep them busy.
+
+        Args:
+            file_names (:obj:`list`): Paths to the CNFs and files containing the parameters for the knowledge compiler.
+            knowledge_compiler (:obj:`string`, optional): The knowledge compiler to use. Defaults to `c2d`.
+            max_workers (:obj:`int`, optional): The maximal number of compilers that run at the same time.
+                Defaults to half the number of cpus so that each compiler can still use about two of them.
+        Returns:
+            None
+        """
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1)//2)
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = [ executor.submit(CNF.compile_single, file_name, knowledge_compiler = knowledge_compiler) for file_name in file_names ]
+            for future in futures:
+                future.result()
+
+    def _file_size(self):
+        # a rough upper bound of the size of the cnf in a file, including the weights
+        return 8*sum(map(len, self.clauses)) + 64*self.nr_vars
 
     def solve_compilation_single(self):
         """Compiles an AMC instance over a single semiring and performs the algebraic model counting over the compiled circuit.
@@ -580,8 +1116,11 @@ class CNF(object):
         Returns:
             object: The value of the AMC instance.
         """
+        from aspmc.compile.circuit import Circuit
+        import aspmc.compile.dtree as dtree
+        import aspmc.compile.vtree as vtree
         start = time.time()
-        cnf_fd, cnf_tmp = tempfile.mkstemp()
+        cnf_fd, cnf_tmp = tempfile.mkstemp(dir = _disk_tmp_dir())
         my_signals.tempfiles.add(cnf_tmp)
         # sharpsat-td-live is a special case since it does not fall into the `first compile then evaluate category`
         if config.config["knowledge_compiler"] == "sharpsat-td-live":
@@ -591,18 +1130,16 @@ class CNF(object):
             decot = max(decot, 0.1)
             # compute the available memory to set the cache size
             available_memory = max(psutil.virtual_memory().available//1024**2 - 125, 1000)
-            p = subprocess.Popen(["./sharpSAT", "-dDNNF", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
+            p = _spawn(["./sharpSAT", "-dDNNF", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
             weights, zero, one, dtype = self.get_weights()
-            results = Circuit.live_parse_wmc(p.stdout, weights, zero = zero, one = one, dtype = dtype)
-            p.wait()
-            p.stdout.close()        
+            with p:
+                results = Circuit.live_parse_wmc(p.stdout, weights, zero = zero, one = one, dtype = dtype)
             if p.returncode != 0:
-                logger.error(f"Knowledge compilation failed with exit code {p.exitcode}.")
+                logger.error(f"Knowledge compilation failed with exit code {p.returncode}.")
                 exit(-1) 
             end = time.time()
             logger.info(f"Counting & Compilation time:  {end - start}")
-            os.remove(cnf_tmp)
-            my_signals.tempfiles.remove(cnf_tmp)
+            _remove_tempfiles([ cnf_tmp ])
             return results
         
         # prepare everything for the compilation
@@ -649,19 +1186,7 @@ class CNF(object):
         logger.info(f"Counting time:            {end - start}")
         
         # remove the temporary files
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.remove(cnf_tmp)
-        os.remove(cnf_tmp+".nnf")
-        my_signals.tempfiles.remove(cnf_tmp + '.nnf')
-        if config.config["knowledge_compiler"] == "c2d":
-            os.remove(cnf_tmp + ".dtree")
-            my_signals.tempfiles.remove(cnf_tmp + '.dtree')
-            if (cnf_tmp + ".exist") in my_signals.tempfiles:
-                os.remove(cnf_tmp + ".exist")
-                my_signals.tempfiles.remove(cnf_tmp + '.exist')
-        elif config.config["knowledge_compiler"] == "miniC2D":
-            os.remove(cnf_tmp + ".vtree")
-            my_signals.tempfiles.remove(cnf_tmp + '.vtree')
+        _remove_tempfiles([ cnf_tmp + suffix for suffix in ("", ".nnf", ".dtree", ".exist", ".vtree") ])
         return results
 
 
@@ -695,21 +1220,22 @@ class CNF(object):
         logger.debug("Knowledge compiler output:")
 
         if knowledge_compiler == "c2d":
-            p = subprocess.Popen([os.path.join(src_path, "c2d/bin/c2d_linux"), "-cache_size", str(available_memory), "-keep_trivial_cls", "-smooth_all", "-in", file_name, "-dt_in", file_name + ".dtree", "-force", file_name + ".force"], stdout=subprocess.PIPE)
+            p = _spawn([os.path.join(src_path, "c2d/bin/c2d_linux"), "-cache_size", str(available_memory), "-keep_trivial_cls", "-smooth_all", "-in", file_name, "-dt_in", file_name + ".dtree", "-force", file_name + ".force"], stdout=subprocess.PIPE)
         elif knowledge_compiler == "miniC2D":
-            p = subprocess.Popen([os.path.join(src_path, "miniC2D/bin/linux/miniC2D"), "-c", file_name, "-v", file_name + ".vtree", "-s" , str(available_memory)], stdout=subprocess.PIPE)
+            p = _spawn([os.path.join(src_path, "miniC2D/bin/linux/miniC2D"), "-c", file_name, "-v", file_name + ".vtree", "-s" , str(available_memory)], stdout=subprocess.PIPE)
         else:
             logger.error(f"Knowledge compiler {config.config['knowledge_compiler']} does not support X/D-constrained compilation")
             exit(-1)
 
-        for line in iter(p.stdout.readline, b''):
-            line = line.decode()
-            logger.debug(line[:-1])
-        p.wait()
-        p.stdout.close()
+        # only decode the output if it is actually logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        with p:
+            for line in p.stdout:
+                if debug:
+                    logger.debug(line[:-1].decode())
 
         if p.returncode != 0:
-            logger.error(f"Knowledge compilation failed with exit code {p.exitcode}.")
+            logger.error(f"Knowledge compilation failed with exit code {p.returncode}.")
             exit(-1) 
 
     def solve_compilation_two(self):
@@ -722,9 +1248,68 @@ class CNF(object):
         Returns:
             object: The value of the 2AMC instance.
         """
+        from aspmc.compile.constrained_sdd import ConstrainedSDD
+        from aspmc.compile.constrained_ddnnf import ConstrainedDDNNF
+        # the circuit only depends on the clauses and the first quantifier, not on the weights,
+        # so a circuit compiled earlier can be evaluated again if config "compilation_cache" allows to keep circuits
+        caching = int(config.config.get("compilation_cache", "0")) > 0
+        key = self._compilation_key() if caching else None
+        if caching and key in _compilation_cache:
+            _compilation_cache.move_to_end(key)
+            nnf_path, v3, _ = _compilation_cache[key]
+            cached = True
+            logger.info("Reusing the circuit of an earlier compilation")
+        else:
+            nnf_path, v3 = self._compile_constrained()
+            cached = False
+            if caching:
+                # constructing a dtree adds clauses, remember the circuit for the changed cnf as well
+                cached = _cache_circuit([ key, self._compilation_key() ], nnf_path, v3)
+        # prepare the inputs
+        start = time.time()
+        P = set(self.quantified[0])
+        weights, _, _, _ = self.get_weights()
+        if config.config["knowledge_compiler"] == "c2d":
+            circ = ConstrainedDDNNF
+        else:
+            circ = ConstrainedSDD(path = None, v3 = v3)
+        end = time.time()
+        logger.info(f"Preparation time:         {end - start}")
         start = time.time()
-        cnf_fd, cnf_tmp = tempfile.mkstemp()
+        try:
+            results = circ.parse_wmc(nnf_path, weights, P, self.semirings[0], self.semirings[1], self.transform)
+        finally:
+            if not cached:
+                _kept_tempfiles.pop(nnf_path, None)
+                _remove_tempfiles([ nnf_path ])
+        end = time.time()
+        logger.info(f"Counting time:            {end - start}")
+        return results
+
+    def _compilation_key(self):
+        key = hashlib.blake2b(f"{config.config['knowledge_compiler']}|{sorted(self.quantified[0])}|".encode(), digest_size = 16)
+        self.to_stream(_HashingWriter(None, key))
+        return key.digest()
+
+    def _compile_constrained(self):
+        """Compiles the cnf into an X/D-constrained circuit with the knowledge compiler in aspmc.config.
+
+        The circuit is kept until the caller removes it (or the interpreter exits), all the other files are removed.
+
+        Returns:
+            (:obj:`string`, :obj:`aspmc.compile.vtree.Vtree`): 
+            
+            The path of the file containing the circuit.
+            
+            The vtree the circuit was compiled for, or None if it was not compiled with miniC2D.
+        """
+        import aspmc.compile.constrained_compile as concom
+        import aspmc.compile.dtree as dtree
+        import aspmc.compile.vtree as vtree
+        start = time.time()
+        cnf_fd, cnf_tmp = tempfile.mkstemp(dir = _disk_tmp_dir())
         my_signals.tempfiles.add(cnf_tmp)
+        v3 = None
         if config.config["knowledge_compiler"] == "c2d":
             (force_vars, d3) = concom.tree_from_cnf(self, tree_type = dtree.Dtree)
             d3.write(cnf_tmp + ".dtree")
@@ -737,9 +1322,11 @@ class CNF(object):
             end = time.time()
             logger.info(f"Dtree time:               {end - start}")
         elif config.config["knowledge_compiler"] == "miniC2D":
-            with os.fdopen(cnf_fd, 'wb') as cnf_file:
-                self.to_stream(cnf_file)
-            (_, v3) = concom.tree_from_cnf(self, tree_type=vtree.Vtree)
+            # constructing the vtree does not change the cnf, so we can write it in the meantime
+            with os.fdopen(cnf_fd, 'wb') as cnf_file, ThreadPoolExecutor(max_workers = 1) as executor:
+                written = executor.submit(self.to_stream, cnf_file)
+                (_, v3) = concom.tree_from_cnf(self, tree_type=vtree.Vtree)
+                written.result()
             v3.write(cnf_tmp + ".vtree")
             my_signals.tempfiles.add(cnf_tmp + '.vtree')
             end = time.time()
@@ -752,67 +1339,79 @@ class CNF(object):
         CNF.compile_two(cnf_tmp, knowledge_compiler = config.config["knowledge_compiler"])
         end = time.time()
         logger.info(f"Compilation time:         {end - start}")
-        # prepare the inputs
-        start = time.time()
-        P = set(self.quantified[0])
-        weights = []
-        for i in range(len(self.weights)):
-            weights.append(self.weights[to_dimacs(i)])
-        if config.config["knowledge_compiler"] == "c2d":
-            circ = ConstrainedDDNNF
-        else:
-            circ = ConstrainedSDD(path = None, v3 = v3)
-        end = time.time()
-        logger.info(f"Preparation time:         {end - start}")
-        start = time.time()
-        results = circ.parse_wmc(cnf_tmp + '.nnf', weights, P, self.semirings[0], self.semirings[1], self.transform)
-        end = time.time()
-        logger.info(f"Counting time:            {end - start}")
-        # clean up the files
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.remove(cnf_tmp)
-        os.remove(cnf_tmp+".nnf")
-        my_signals.tempfiles.remove(cnf_tmp + '.nnf')
-        if config.config["knowledge_compiler"] == "c2d":
-            os.remove(cnf_tmp + ".dtree")
-            my_signals.tempfiles.remove(cnf_tmp + '.dtree')
-            os.remove(cnf_tmp + ".force")
-            my_signals.tempfiles.remove(cnf_tmp + '.force')
-        else:
-            os.remove(cnf_tmp + ".vtree")
-            my_signals.tempfiles.remove(cnf_tmp + '.vtree')
-        return results
+        # keep the circuit but clean up the other files
+        _kept_tempfiles[cnf_tmp + ".nnf"] = os.getpid()
+        _remove_tempfiles([ cnf_tmp + suffix for suffix in ("", ".dtree", ".force", ".vtree") ])
+        return (cnf_tmp + ".nnf", v3)
 
     def preprocessing(self):
         start = time.time()
+        if len(self.clauses) == 0:
+            # there is nothing to simplify, so we do not need to start the preprocessor at all
+            logger.info(f"Preprocessing time:       {time.time() - start}")
+            return
+        min_clauses = int(config.config["preprocessing_min_clauses"])
+        if len(self.clauses) < min_clauses:
+            logger.info(f"Skipping preprocessing of {len(self.clauses)} clauses (config preprocessing_min_clauses is {min_clauses})")
+            return
         if len(self.semirings) == 1 and self.semirings[0].is_idempotent(): # TODO make sure is_idempotent() is always implemented
             mode = "idemp"
         else:
             mode = "general"
-        
-        (cnf_file_fd, cnf_file_tmp) = tempfile.mkstemp()
-        my_signals.tempfiles.add(cnf_file_tmp)
 
-        with os.fdopen(cnf_file_fd, mode = 'w') as cnf_file:
-            cnf_file.write(str(self)) 
-        
-        q = subprocess.Popen([os.path.join(src_path, "preprocessor/bin/sharpSAT"), "-m", mode, "-t", "FPVEG", cnf_file_tmp], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        output, err = q.communicate()
-        
-        self.clauses = [] 
-        cnf_reached = False
-        for line in output.decode().split('\n'):
-            line = line.split()
-            if len(line) > 0 and not line[0] == 'c':
-                if line[0] == 'p' and line[1] == "cnf":
-                    cnf_reached = True
-                    self.nr_vars = int(line[2]) # TODO: instead check if value has changed (which should not happen)
-                elif cnf_reached:
-                    line = [int(l) for l in line]
-                    self.clauses.append(line[:-1])
+        # trivial and duplicate clauses do not change the models, so there is no need to pass them on
+        self.remove_trivial_clauses()
+        self.remove_duplicate_clauses()
+        # stream the cnf to the file and hash it on the way, so that it is never held in memory as a whole
+        with _pooled_tempfile("preprocessing", self._file_size()) as cnf_file_tmp:
+            key = hashlib.blake2b(mode.encode() + b"|", digest_size = 16)
+            with open(cnf_file_tmp, mode = 'wb') as cnf_file:
+                self.to_stream(_HashingWriter(cnf_file, key), extras = True)
+            key = key.digest()
+            if key in _preprocessing_cache:
+                _preprocessing_cache.move_to_end(key)
+                nr_vars, lits, offsets = _preprocessing_cache[key]
+                self.nr_vars = nr_vars
+                lits = lits.tolist()
+                offsets = offsets.tolist()
+                self.clauses = [ lits[begin:end] for begin, end in zip(offsets[:-1], offsets[1:]) ]
+                logger.info(f"Preprocessing time:       {time.time() - start}")
+                return
+
+            # the preprocessor handles a single cnf file per run, so it cannot be kept alive across calls
+            q = _spawn([os.path.join(src_path, "preprocessor/bin/sharpSAT"), "-m", mode, "-t", "FPVEG", cnf_file_tmp], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, bufsize=1<<16)
+            clauses = []
+            clause_lines = []
+            cnf_reached = False
+            # read the output while the preprocessor writes it and parse the clauses in blocks, 
+            # so that the whole output is never held in memory at once
+            # work on the bytes directly so that the output never needs to be decoded
+            with q:
+                for line in q.stdout:
+                    first = line[:1]
+                    if first == b'c' or line.isspace():
+                        continue
+                    if first == b'p':
+                        line = line.split()
+                        if line[1] == b"cnf":
+                            cnf_reached = True
+                            self.nr_vars = int(line[2]) # TODO: instead check if value has changed (which should not happen)
+                    elif cnf_reached:
+                        clause_lines.append(line)
+                        if len(clause_lines) >= 65536:
+                            clauses.extend(_parse_clauses(b"\n".join(clause_lines)))
+                            clause_lines = []
+        # the output of a preprocessor that crashed or was killed may be incomplete, so it must neither be used nor cached
+        if q.returncode != 0:
+            logger.error(f"Preprocessing failed with exit code {q.returncode}.")
+            exit(-1)
+        clauses.extend(_parse_clauses(b"\n".join(clause_lines)))
+        self.clauses = clauses
         end = time.time()
-        os.remove(cnf_file_tmp)
-        my_signals.tempfiles.remove(cnf_file_tmp)
+        # the clauses may be modified later on, so the cache keeps its own copy as compact arrays
+        _preprocessing_cache[key] = (self.nr_vars, ) + self.clause_arrays()
+        if len(_preprocessing_cache) > _PREPROCESSING_CACHE_SIZE:
+            _preprocessing_cache.popitem(last = False)
         logger.info(f"Preprocessing time:       {end - start}")
 
     def evaluate(self, strategy = "flexible", preprocessing = False):
@@ -847,6 +1446,36 @@ class CNF(object):
             logger.error(f"Unknown evaluation strategy {strategy}.")
             exit(-1)
 
+    @staticmethod
+    def evaluate_batch(cnfs, strategy = "flexible", preprocessing = False, max_workers = None):
+        """Evaluates several AMC instances in parallel, each in its own process using `CNF.evaluate()`.
+
+        The knowledge compilers and solvers are external binaries, but parsing and evaluating their output is done in python.
+        Using processes instead of threads lets the evaluations of different instances run at the same time.
+        The instances are handed to the workers in the extended cnf format, the configuration of aspmc.config is copied.
+
+        Args:
+            cnfs (:obj:`list`): The cnfs to evaluate.
+            strategy (:obj:`string`, optional): Which strategy to use for evaluation. Default is `"flexible"`.
+            preprocessing (:obj:`bool`, optional): Whether to preprocess the cnfs. Default is `False`.
+            max_workers (:obj:`int`, optional): The maximal number of instances that are evaluated at the same time.
+                Defaults to the number of cpus.
+        Returns:
+            list: The values of the AMC instances in the same order as `cnfs`.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        if len(cnfs) == 0:
+            return []
+        configuration = dict(config.config)
+        encoded = []
+        for cnf in cnfs:
+            stream = io.BytesIO()
+            cnf.to_stream(stream, extras = True)
+            encoded.append(stream.getvalue())
+        with ProcessPoolExecutor(max_workers = min(max_workers or os.cpu_count() or 1, len(cnfs))) as executor:
+            futures = [ executor.submit(_evaluate_encoded, data, strategy, preprocessing, configuration) for data in encoded ]
+            return [ future.result() for future in futures ]
+
     def solve_compilation(self, preprocessing = False):   
         """Compiles an AMC instance and performs the algebraic model counting over the compiled circuit.
 
@@ -878,169 +1507,156 @@ class CNF(object):
         return results
 
     def solve_maxsat(self):
-        cnf_fd, cnf_tmp = tempfile.mkstemp()
-        my_signals.tempfiles.add(cnf_tmp)
-        logger.debug(f"    MaxSAT CNF file: {cnf_tmp}")
         # first we check whether this is actually a MaxSAT instance or whether it is just a SAT instance in disguise
-        import math
-        real_weights = { l : w[0].value for l,w in self.weights.items() }
-        if self.semirings[0].__name__ == "aspmc.semirings.maxtimes":
-            # we first need to convert into maxplus weights
-            real_weights = { l : math.log(w) if w > 0 else float("-inf") for l,w in real_weights.items() }
-        elif self.semirings[0].__name__ == "aspmc.semirings.minplus":
-            # we first need to convert into maxplus weights
-            real_weights = { l : -w if w != float("inf") else float("-inf") for l,w in real_weights.items() }
-        elif self.semirings[0].__name__ != "aspmc.semirings.maxplus":
-            logger.error(f"MaxSAT evaluation is currently not supported for semiring {self.semirings[0].__name__}")
-            exit(-1)
-        # sort out variables that are irrelevant
-        real_weights = { l : w for l,w in real_weights.items() if w != real_weights[-l]}
-        # handle hard constraints from literals with weight -inf and keep the rest
-        negated_units = [ l for l,w in real_weights.items() if w == float('-inf')]
-        real_weights = { l : w for l,w in real_weights.items() if w != float('-inf') and abs(w) > 0}
-
+        maxplus_weights = self._maxplus_weights()
+        pos, neg, negated_units = maxplus_weights
+        negated_units = negated_units.tolist()
+        is_sat = not np.any((pos != 0) & ~np.isnan(pos)) and not np.any((neg != 0) & ~np.isnan(neg))
 
         (weights, zero, one, dtype) = self.get_weights()
         first_shape = (np.shape(weights[0])[0], ) + np.shape(one)
-        if len(real_weights) == 0:
+        # the result buffer is allocated once and filled with the neutral element of the outcome
+        weight = np.empty(first_shape, dtype=dtype)
+        if is_sat:
             # this is a SAT instance!
-            with os.fdopen(cnf_fd, mode='wb') as cnf_out:
-                # create result file
-                res_fd, res_tmp = tempfile.mkstemp()
-                my_signals.tempfiles.add(res_tmp)
-                # write the cnf with the additional negated unit literals
-                cnf_out.write(f"p cnf {self.nr_vars} {len(self.clauses) + len(negated_units)}\n".encode())
-                for c in self.clauses:
-                    cnf_out.write(f"{' '.join([str(l) for l in c])} 0\n".encode())
-                for lit in negated_units:
-                    cnf_out.write(f"{-lit} 0\n".encode())
+            # create result file
+            with _pooled_tempfile("maxsat", self._file_size()) as cnf_tmp, _pooled_tempfile("maxsat result", 8*self.nr_vars) as res_tmp:
+                logger.debug(f"    SAT CNF file: {cnf_tmp}")
+                with open(cnf_tmp, mode='wb') as cnf_out:
+                    # write the cnf with the additional negated unit literals
+                    cnf_out.write(b"p cnf %d %d\n" % (self.nr_vars, len(self.clauses) + len(negated_units)))
+                    self._write_clauses(cnf_out)
+                    cnf_out.write(b"".join(b"%d 0\n" % -lit for lit in negated_units))
                 # solve
-                p = subprocess.Popen([os.path.join(src_path, "minisat-definitions/bin/minisat"), cnf_tmp, res_tmp], stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds = True)
-                p.wait()
-                output = p.stdout.read().decode().split("\n")
-                for line in output:
-                    line = line.split()
-                    if len(line) == 0:
-                        continue
-                    if line[0] == 'UNSATISFIABLE':
-                        weight = np.empty(first_shape, dtype=dtype)
-                        weight[:] = zero
-                        solution = list(range(1,self.nr_vars + 1))
-                        p.stdout.close()
-                    elif line[0] == 'SATISFIABLE':
-                        with os.fdopen(res_fd, mode='r') as result_file:
-                            solution = result_file.read().split('\n')[1]
-                        solution = [ int(v) for v in solution.split(' ') if v != '' ]
-                        weight = np.empty(first_shape, dtype=dtype)
-                        weight[:] = one
-                        for lit in solution:
-                            weight *= weights[to_pos(lit)]
-                        p.stdout.close()
-                os.remove(res_tmp)
-                my_signals.tempfiles.remove(res_tmp)
+                p = _spawn([minisat_path, cnf_tmp, res_tmp], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=1<<20)
+                # only the status line is of interest, so we read the output line by line as bytes
+                status = None
+                # the assignment is only complete once minisat has terminated, which is ensured when leaving the block
+                with p:
+                    for line in p.stdout:
+                        if line.startswith(b'UNSATISFIABLE') or line.startswith(b'SATISFIABLE'):
+                            status = line.split()[0]
+                if status == b'UNSATISFIABLE':
+                    weight[:] = zero
+                    solution = list(range(1,self.nr_vars + 1))
+                elif status == b'SATISFIABLE':
+                    with open(res_tmp, mode='rb') as result_file:
+                        solution = result_file.read().split(b'\n')[1]
+                    # the assignment is terminated by a 0, which is not a literal
+                    solution = np.fromstring(solution, dtype = np.int64, sep = " ")
+                    solution = solution[solution != 0]
+                    weight[:] = one
+                    self._multiply_assignment(weight, solution)
+                else:
+                    raise SolvingError("SAT solver did not print a result!")
         else:
             logger.info("   Stats MaxSAT")
             logger.info("------------------------------------------------------------")
             start = time.time()
-            with os.fdopen(cnf_fd, mode='wb') as cnf_out:
-                self.write_maxsat_cnf(cnf_out)
-            p = subprocess.Popen([os.path.join(src_path, "UWrMaxSAT/uwrmaxsat/build/release/bin/uwrmaxsat"), "-no-bin", "-no-sat", "-m", "-bm", "-maxpre-time=10", cnf_tmp], stdout=subprocess.PIPE, close_fds = True)#, stderr=subprocess.PIPE)
-            solution = None
-            while p.poll() is None or solution is None:
-                line = p.stdout.readline().decode()
-                if len(line) == 0:
-                    continue
-                if line.startswith("s"):
-                    if line[2:] == "OPTIMUM FOUND":
-                        continue
-                    elif line[2:] == "UNKNOWN":
-                        raise SolvingError("MaxSAT solver returned UNKNOWN")
-                    elif line[2:] == "SATISFIABLE":
-                        raise SolvingError("MaxSAT solver returned SATISFIABLE. Probably it was interrupted during execution")
-                    elif line[2:] == "UNSATISFIABLE":
-                        weight = np.empty(first_shape, dtype=dtype)
-                        weight[:] = zero
-                        solution = list(range(1,self.nr_vars + 1))
-                elif line[0] == 'v':
-                    bitset = line[2:-1]
-                    solution = [ i if bitset[i-1] == '1' else -i for i in range(1,self.nr_vars + 1)]
-                    weight = np.empty(first_shape, dtype=dtype)
-                    weight[:] = one
-                    for lit in solution:
-                        weight *= weights[to_pos(lit)]
-            p.stdout.close()
+            if not os.path.isfile(uwrmaxsat_path):
+                raise SolvingError(f"MaxSAT solver not found at {uwrmaxsat_path}")
+            # uwrmaxsat gets the instance as a named file instead of through a pipe, 
+            # the pooled file is kept in memory if there is room for it
+            with _pooled_tempfile("maxsat", self._file_size()) as cnf_tmp:
+                logger.debug(f"    MaxSAT CNF file: {cnf_tmp}")
+                with open(cnf_tmp, mode='wb') as cnf_out:
+                    self.write_maxsat_cnf(cnf_out, maxplus_weights = maxplus_weights)
+                p = _spawn([uwrmaxsat_path, "-no-bin", "-no-sat", "-m", "-bm", "-maxpre-time=10", cnf_tmp], stdout=subprocess.PIPE, bufsize=1<<16)#, stderr=subprocess.PIPE)
+                solution = None
+                # iterate over the buffered output until EOF, only the status and assignment lines are decoded
+                try:
+                    for line in p.stdout:
+                        line = line.rstrip()
+                        if len(line) == 0:
+                            continue
+                        if line.startswith(b"s"):
+                            status = line[2:]
+                            if status == b"OPTIMUM FOUND":
+                                continue
+                            elif status == b"UNKNOWN":
+                                raise SolvingError("MaxSAT solver returned UNKNOWN")
+                            elif status == b"SATISFIABLE":
+                                raise SolvingError("MaxSAT solver returned SATISFIABLE. Probably it was interrupted during execution")
+                            elif status == b"UNSATISFIABLE":
+                                weight[:] = zero
+                                solution = list(range(1,self.nr_vars + 1))
+                        elif line.startswith(b"v"):
+                            # the assignment is a string of 0s and 1s, which we read as bytes without decoding
+                            bitset = np.frombuffer(line[2:self.nr_vars + 2], dtype = np.uint8)
+                            # flip the sign of the false variables in place instead of building the negated literals first
+                            solution = np.arange(1, self.nr_vars + 1)
+                            solution[bitset != ord('1')] *= -1
+                            weight[:] = one
+                            self._multiply_assignment(weight, solution)
+                finally:
+                    # the solver has to be reaped even if its output reports a failure
+                    p.stdout.close()
+                    p.wait()
             if solution is None:
                 raise SolvingError("MaxSAT solver did not print an assignment!")
             
             logger.info(f"Solving time:         {time.time() - start}")
             logger.info("------------------------------------------------------------")
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.add(cnf_tmp)
         return weight
 
 
     def solve_wmc(self):
-        _, cnf_tmp = tempfile.mkstemp()
-        my_signals.tempfiles.add(cnf_tmp)
-        logger.debug(f"    WCNF file: {cnf_tmp}")
-        self.to_file(cnf_tmp, extras=True)
-        logger.info("   Stats Model Counter")
-        logger.info("------------------------------------------------------------")
-        start = time.time()
-        decot = float(config.config["decot"])
-        decot = max(decot, 0.1)
-        # compute the available memory to set the cache size
-        available_memory = max(psutil.virtual_memory().available//1024**2 - 125, 1000)
-        first = None
-        for weight in self.weights.values():
-            first = weight
-            break
-        p = subprocess.Popen(["./sharpSAT", "-MWD", str(len(first)), "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
-        result = None
-        logger.debug("Solver output:")
-        for line in iter(p.stdout.readline, b''):
-            line = line.decode()
-            if line.startswith("c s exact arb float "):
-                result = np.array([ float(part) for part in line[len("c s exact arb float "):-1].split(";") ])
-            logger.debug(line[:-1])
-        p.wait()
-        p.stdout.close()
+        with _pooled_tempfile("wmc", self._file_size()) as cnf_tmp:
+            logger.debug(f"    WCNF file: {cnf_tmp}")
+            self.to_file(cnf_tmp, extras=True)
+            logger.info("   Stats Model Counter")
+            logger.info("------------------------------------------------------------")
+            start = time.time()
+            decot = float(config.config["decot"])
+            decot = max(decot, 0.1)
+            # compute the available memory to set the cache size
+            available_memory = max(psutil.virtual_memory().available//1024**2 - 125, 1000)
+            first = None
+            for weight in self.weights.values():
+                first = weight
+                break
+            p = _spawn(["./sharpSAT", "-MWD", str(len(first)), "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
+            result = None
+            logger.debug("Solver output:")
+            debug = logger.isEnabledFor(logging.DEBUG)
+            # iterate over the buffered output until EOF, there is no need to collect it first
+            with p:
+                for line in p.stdout:
+                    if line.startswith(b"c s exact arb float "):
+                        result = np.array([ float(part) for part in line[len(b"c s exact arb float "):].rstrip().split(b";") ])
+                    if debug:
+                        logger.debug(line[:-1].decode())
         if result is None:
             raise SolvingError("Model Counter did not print a solution!")
         
         logger.info(f"Counting time:         {time.time() - start}")
         logger.info("------------------------------------------------------------")
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.add(cnf_tmp)
         return result
 
     def solve_mc(self):
-        _, cnf_tmp = tempfile.mkstemp()
-        my_signals.tempfiles.add(cnf_tmp)
-        logger.debug(f"    CNF file: {cnf_tmp}")
-        self.to_file(cnf_tmp, extras=False)
-        logger.info("   Stats Model Counter")
-        logger.info("------------------------------------------------------------")
-        start = time.time()
-        decot = float(config.config["decot"])
-        decot = max(decot, 0.1)
-        # compute the available memory to set the cache size
-        available_memory = max(psutil.virtual_memory().available//1024**2 - 125, 1000)
-        p = subprocess.Popen(["./sharpSAT", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
-        result = None
-        logger.debug("Solver output:")
-        for line in iter(p.stdout.readline, b''):
-            line = line.decode()
-            if line.startswith("c s exact arb int "):
-                result = np.array([ int(line[len("c s exact arb int "):-1]) ])
-            logger.debug(line[:-1])
-        p.wait()
-        p.stdout.close()
+        with _pooled_tempfile("mc", self._file_size()) as cnf_tmp:
+            logger.debug(f"    CNF file: {cnf_tmp}")
+            self.to_file(cnf_tmp, extras=False)
+            logger.info("   Stats Model Counter")
+            logger.info("------------------------------------------------------------")
+            start = time.time()
+            decot = float(config.config["decot"])
+            decot = max(decot, 0.1)
+            # compute the available memory to set the cache size
+            available_memory = max(psutil.virtual_memory().available//1024**2 - 125, 1000)
+            p = _spawn(["./sharpSAT", "-decot", str(decot), "-decow", "10000", "-tmpdir", "/tmp/", "-cs", str(available_memory//2), cnf_tmp], cwd=os.path.join(src_path, "sharpsat-td/bin/"), stdout=subprocess.PIPE)
+            result = None
+            logger.debug("Solver output:")
+            debug = logger.isEnabledFor(logging.DEBUG)
+            with p:
+                for line in p.stdout:
+                    if line.startswith(b"c s exact arb int "):
+                        result = np.array([ int(line[len(b"c s exact arb int "):].rstrip()) ])
+                    if debug:
+                        logger.debug(line[:-1].decode())
         if result is None:
             raise SolvingError("Model Counter did not print a solution!")
         
         logger.info(f"Counting time:         {time.time() - start}")
         logger.info("------------------------------------------------------------")
-        os.remove(cnf_tmp)
-        my_signals.tempfiles.add(cnf_tmp)
         return result
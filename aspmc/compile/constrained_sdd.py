@@ -149,10 +149,10 @@ class ConstrainedSDD(object):
         transform = lambda x : first_semiring.from_value(f_transform(x))
 
         separator_node = self.separator_node(P)
-        for i in range(len(self.literals)):
-            if abs(to_dimacs(i)) in P:
+        for i, v in enumerate(np.abs(to_dimacs_array(len(self.literals))).tolist()):
+            if v in P:
                 self.literals[i].weight = weights[i]
-            elif self.lca[separator_node][abs(to_dimacs(i))] == separator_node: 
+            elif self.lca[separator_node][v] == separator_node: 
                 self.literals[i].weight = weights[i]
             else:
                 self.literals[i].weight = np.array([ transform(w) for w in weights[i] ])
@@ -260,8 +260,8 @@ class ConstrainedSDD(object):
         transform = lambda x : first_semiring.from_value(f_transform(x))
 
         separator_node = self.separator_node(P)
-        for i in range(len(weights)):
-            if abs(to_dimacs(i)) not in P and self.lca[separator_node][abs(to_dimacs(i))] != separator_node: 
+        for i, v in enumerate(np.abs(to_dimacs_array(len(weights))).tolist()):
+            if v not in P and self.lca[separator_node][v] != separator_node: 
                 weights[i] = np.array([ transform(w) for w in weights[i] ])
         
         index_to_node = { node.idx : node for node in self.vtree }
@@ -14,21 +14,16 @@ class Vtree(bintree):
     """
     def __str__(self):
         self.index()
-        res = ""
-        res += f"vtree {2*self.leaf_count() - 1}\n"
-        cur_max = -1
-        def get_next():
-            nonlocal cur_max
-            cur_max += 1
-            return cur_max
+        lines = [ f"vtree {2*self.leaf_count() - 1}" ]
         for node in self:
+            # the nodes are numbered in the order they are written
+            node.w_idx = len(lines) - 1
             if node.val is not None:
-                node.w_idx = get_next()
-                res += f"L {node.w_idx} {node.val}\n"
+                lines.append(f"L {node.w_idx} {node.val}")
             else:
-                node.w_idx = get_next()
-                res += f"I {node.w_idx} {node.left.w_idx} {node.right.w_idx}\n"
-        return res
+                lines.append(f"I {node.w_idx} {node.left.w_idx} {node.right.w_idx}")
+        lines.append("")
+        return "\n".join(lines)
 
 
 def from_order(order):
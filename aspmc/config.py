@@ -5,5 +5,8 @@ config = {
     "constrained" : "XD",
     "backdoort" : "30",
     "backdoors" : "fvs",
-    "number_cores" : "1"
+    "number_cores" : "1",
+    "preprocessing_min_clauses" : "0",
+    "tmpdir" : "auto",
+    "compilation_cache" : "0"
 }
\ No newline at end of file
@@ -1,4 +1,5 @@
 import networkx as nx
+from itertools import combinations
 
 class Hypergraph(object):
     """A class for Hypergraphs, i.e. graphs that have hyperedges, 
@@ -61,5 +62,5 @@ class Hypergraph(object):
         graph = nx.Graph()
         graph.add_nodes_from(self.nodes)
         for edge in self.edges:
-            graph.add_edges_from(sum([ [ (v, vp) for v in edge if v != vp ] for vp in edge ], []))
+            graph.add_edges_from(combinations(set(edge), 2))
         return graph
\ No newline at end of file
@@ -3,10 +3,14 @@ Tree Decomposition module that introduces a tree decomposition class, a bag clas
 """
 
 import networkx as nx
+import numpy as np
+from collections import deque
+from itertools import chain
 import subprocess
+import gc
+import functools
 import inspect
 import os
-import queue
 import logging
 import time
 
@@ -15,6 +19,61 @@ src_path = os.path.realpath(os.path.join(src_path, '../../external'))
 
 logger = logging.getLogger("aspmc")
 
+def _find_centroid_python(parents, introduced, half):
+    # the nodes are given in post order, so the children of each node come before it and the root comes last
+    # `partial[p]` is the number of vertices introduced in the subtrees of the children of `p` seen so far, 
+    # the first node for which this exceeds `half` is the centroid
+    partial = [ 0 ]*len(parents)
+    for cur in range(len(parents) - 1):
+        parent = parents[cur]
+        partial[parent] += partial[cur] + introduced[cur]
+        if partial[parent] > half:
+            return parent
+    # no subtree below the root contains more than half of the vertices
+    return len(parents) - 1
+
+def _find_containing_numpy(vertices, owners, targets, nr_bags):
+    # the first bag that contains all of the (unique) `targets`, or -1 if there is none
+    hits = np.bincount(owners[np.isin(vertices, targets)], minlength = nr_bags)
+    matches = np.flatnonzero(hits == len(targets))
+    return matches[0] if len(matches) > 0 else -1
+
+@functools.lru_cache(maxsize = None)
+def _numba_kernels():
+    # numba is optional and slow to import, so it is only loaded (and the kernels compiled) 
+    # the first time a tree decomposition is large enough for them to pay off
+    # returns the pair `(find_centroid, find_containing)` or None if numba is not available
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+
+    @njit(cache = True)
+    def find_centroid(parents, introduced, half):
+        # the same as `_find_centroid_python`
+        partial = np.zeros(len(parents), dtype = np.int64)
+        for cur in range(len(parents) - 1):
+            parent = parents[cur]
+            partial[parent] += partial[cur] + introduced[cur]
+            if partial[parent] > half:
+                return parent
+        return len(parents) - 1
+
+    @njit(cache = True)
+    def find_containing(vertices, owners, targets, nr_bags):
+        # the same as `_find_containing_numpy` for sorted `targets`
+        hits = np.zeros(nr_bags, dtype = np.int64)
+        for i in range(len(vertices)):
+            j = np.searchsorted(targets, vertices[i])
+            if j < len(targets) and targets[j] == vertices[i]:
+                hits[owners[i]] += 1
+        for bag in range(nr_bags):
+            if hits[bag] == len(targets):
+                return bag
+        return -1
+
+    return find_centroid, find_containing
+
 class Bag(object):
     """A class for bags of tree decompositions.
 
@@ -63,6 +122,7 @@ class TreeDecomposition(object):
         self.vertices = vertices
         self.tree = tree
         self.root = None
+        self._index_tree()
         if root is not None:
             self.set_root(root)
 
@@ -72,7 +132,7 @@ class TreeDecomposition(object):
         Returns:
             :obj:`Bag`: The bag of the root node.
         """
-        return self.tree.nodes[self.root]["bag"]
+        return self._bag_of[self.root]
 
     def get_bag(self, node):
         """Return the bag of given node.
@@ -83,7 +143,23 @@ class TreeDecomposition(object):
         Returns:
             :obj:`Bag`: The bag of the node.
         """
-        return self.tree.nodes[node]["bag"]
+        return self._bag_of[node]
+
+    def _index_tree(self):
+        # plain lists and arrays indexed by the node ids, so that the traversals do not go through the dicts of the graph
+        # `_bag_of` holds the same objects as the "bag" attributes of the nodes and the neighbors of each node
+        # are stored in CSR format (`_adj_indptr`, `_adj_indices`) in the order of their adjacency in the graph
+        adj = self.tree.adj
+        nodes = sorted(adj)
+        size = nodes[-1] + 1 if len(nodes) > 0 else 1
+        self._bag_of = [ None ]*size
+        for node, data in self.tree.nodes(data = True):
+            self._bag_of[node] = data.get("bag")
+        sizes = np.zeros(size, dtype = np.int32)
+        sizes[nodes] = [ len(adj[node]) for node in nodes ]
+        self._adj_indptr = np.zeros(size + 1, dtype = np.int32)
+        np.cumsum(sizes, out = self._adj_indptr[1:])
+        self._adj_indices = np.fromiter(chain.from_iterable(adj[node] for node in nodes), dtype = np.int32, count = int(self._adj_indptr[-1]))
 
     def set_root(self, root):
         """Sets the root of the tree decomposition.
@@ -97,67 +173,99 @@ class TreeDecomposition(object):
         """
         first = self.root is None
         self.root = root
-        stack = queue.LifoQueue()
-        stack.put((-1, self.root, self.tree.neighbors(self.root)))
-        while not stack.empty():
-            parent, cur, neighbors = stack.get()
-            try:
-                neigh = next(neighbors)
-                if neigh == parent:
-                    neigh = next(neighbors)
-                stack.put((parent, cur, neighbors))
-                stack.put((cur, neigh, self.tree.neighbors(neigh)))
-            except:
-                if first:
-                    vertices = self.tree.nodes[cur]["bag"]
-                else:
-                    vertices = self.tree.nodes[cur]["bag"].vertices
-                self.tree.nodes[cur]["bag"] = Bag(cur, vertices, [ self.tree.nodes[x]["bag"] for x in self.tree.neighbors(cur) if x != parent ])
+        # the children of every node in the order of their adjacency, 
+        # so that the traversals do not need to skip the parent among the neighbors of each node
+        indptr = self._adj_indptr.tolist()
+        indices = self._adj_indices.tolist()
+        self._children = [ None ]*len(self._bag_of)
+        self._children[root] = []
+        todo = deque([ root ])
+        while todo:
+            cur = todo.popleft()
+            children = self._children[cur]
+            for neigh in indices[indptr[cur]:indptr[cur + 1]]:
+                if self._children[neigh] is None:
+                    self._children[neigh] = []
+                    children.append(neigh)
+                    todo.append(neigh)
+        # the post order only changes with the root, so it is computed once here and reused by every iteration
+        self._post_order = []
+        # the stack contains the nodes on the path from the root together with the index of their next child
+        stack = [ (self.root, 0) ]
+        while stack:
+            cur, idx = stack[-1]
+            children = self._children[cur]
+            if idx < len(children):
+                stack[-1] = (cur, idx + 1)
+                stack.append((children[idx], 0))
+            else:
+                stack.pop()
+                self._post_order.append(cur)
+        bag_of = self._bag_of
+        if first:
+            # the bags of the children must be created before the bag of their parent
+            for cur in self._post_order:
+                bag_of[cur] = Bag(cur, bag_of[cur], [ bag_of[x] for x in self._children[cur] ])
+                self.tree.nodes[cur]["bag"] = bag_of[cur]
+        else:
+            # the bags already exist, only their children change with the root
+            for cur in self._post_order:
+                bag = bag_of[cur]
+                bag.idx = cur
+                bag.children = [ bag_of[x] for x in self._children[cur] ]
+
+    def _vertex_arrays(self):
+        # the vertices of all bags in post order as one flat integer array, together with the position of their bag in the post order
+        # they are collected from the bags on every call, since the vertex sets of the bags may be modified from the outside
+        bags = [ self._bag_of[cur].vertices for cur in self._post_order ]
+        sizes = np.fromiter(map(len, bags), dtype = np.int64, count = len(bags))
+        vertices = np.fromiter(chain.from_iterable(bags), dtype = np.int64, count = int(sizes.sum()))
+        owners = np.repeat(np.arange(len(bags)), sizes)
+        return vertices, owners
+
+    def _parent_positions(self):
+        # the position in the post order of the parent of each node in the post order (-1 for the root)
+        position = [ 0 ]*len(self._bag_of)
+        for i, cur in enumerate(self._post_order):
+            position[cur] = i
+        sizes = np.fromiter((len(self._children[cur]) for cur in self._post_order), dtype = np.int64, count = len(self._post_order))
+        children = np.fromiter((position[child] for cur in self._post_order for child in self._children[cur]), dtype = np.int64, count = int(sizes.sum()))
+        parents = np.full(len(self._post_order), -1, dtype = np.int64)
+        parents[children] = np.repeat(np.arange(len(self._post_order)), sizes)
+        return parents
+
+    def _introduced_counts(self, parents):
+        # the number of vertices in the bag of each node that are not in the bag of its parent (all of them for the root)
+        vertices, owners = self._vertex_arrays()
+        # identify each occurrence of a vertex by its bag and the vertex itself, 
+        # then a vertex is not introduced if the same vertex occurs in the bag of the parent
+        if len(vertices) > 0:
+            vertices = vertices - vertices.min()
+            offset = int(vertices.max()) + 1
+        else:
+            offset = 1
+        occurrences = owners*offset + vertices
+        in_parent = np.isin(parents[owners]*offset + vertices, occurrences)
+        return np.bincount(owners[~in_parent], minlength = len(self._post_order))
 
     def find_centroid(self):
-        import sys
         if self.root is None:
             self.set_root(1)
         if self.bags == 1:
             return 1
-        stack = queue.LifoQueue()
-        stack.put((-1, self.root, self.tree.neighbors(self.root), 0))
-        while not stack.empty():
-            finished = True
-            while finished:
-                finished = False
-                parent, cur, neighbors, count = stack.get()
-                try:
-                    neigh = next(neighbors)
-                    if neigh == parent:
-                        neigh = next(neighbors)
-                    stack.put((parent, cur, neighbors, count))
-                    stack.put((cur, neigh, self.tree.neighbors(neigh), 0))
-                except StopIteration:
-                    finished = True
-                    here_count = len(self.get_bag(cur).vertices.difference(self.get_bag(parent).vertices))
-                    here_count += count
-                    pp, pc, pn, pcount = stack.get()
-                    if here_count + pcount > self.vertices//2:
-                        return pc
-                    stack.put((pp, pc, pn, pcount + here_count))
-
+        parents = self._parent_positions()
+        introduced = self._introduced_counts(parents)
+        kernels = _numba_kernels() if len(self._post_order) > 100000 else None
+        if kernels is not None:
+            centroid = kernels[0](parents, introduced, self.vertices//2)
+        else:
+            centroid = _find_centroid_python(parents.tolist(), introduced.tolist(), self.vertices//2)
+        return self._post_order[centroid]
 
     def __iter__(self):
         if self.root is None:
             self.set_root(1)
-        stack = queue.LifoQueue()
-        stack.put((-1, self.root, self.tree.neighbors(self.root)))
-        while not stack.empty():
-            parent, cur, neighbors = stack.get()
-            try:
-                neigh = next(neighbors)
-                if neigh == parent:
-                    neigh = next(neighbors)
-                stack.put((parent, cur, neighbors))
-                stack.put((cur, neigh, self.tree.neighbors(neigh)))
-            except:
-                yield cur
+        return iter(self._post_order)
 
     def __str__(self):
         res = f"s tw {self.bags} {self.width} {self.vertices}\n"
@@ -180,24 +288,21 @@ class TreeDecomposition(object):
         """    
         if order == "post-order":
             for bag in self:
-                yield self.tree.nodes[bag]["bag"]
+                yield self._bag_of[bag]
         elif order == "pre-order":
             if self.root is None:
                 self.set_root(1)
-            stack = queue.LifoQueue()
-            stack.put((-1, self.root, self.tree.neighbors(self.root)))
-            yield self.get_bag(self.root)
-            while not stack.empty():
-                parent, cur, neighbors = stack.get()
-                try:
-                    neigh = next(neighbors)
-                    if neigh == parent:
-                        neigh = next(neighbors)
-                    stack.put((parent, cur, neighbors))
-                    stack.put((cur, neigh, self.tree.neighbors(neigh)))
-                    yield self.get_bag(neigh)
-                except:
-                    continue
+            stack = [ (self.root, 0) ]
+            yield self._bag_of[self.root]
+            while stack:
+                cur, idx = stack[-1]
+                children = self._children[cur]
+                if idx < len(children):
+                    stack[-1] = (cur, idx + 1)
+                    stack.append((children[idx], 0))
+                    yield self._bag_of[children[idx]]
+                else:
+                    stack.pop()
         else:
             logger.error(f"Unsupported order {order}.")
             exit(-1)
@@ -211,9 +316,17 @@ class TreeDecomposition(object):
         Returns:
             :obj:`Bag`: A bag containg all the vertices in `vertices` or `None` if there is no such bag.
         """
-        for t in self:
-            if self.tree.nodes[t]["bag"].vertices.issuperset(vertices):
-                return t
+        if self.root is None:
+            self.set_root(1)
+        targets = np.unique(np.fromiter(vertices, dtype = np.int64))
+        bag_vertices, owners = self._vertex_arrays()
+        kernels = _numba_kernels() if len(bag_vertices) > 100000 else None
+        if kernels is not None:
+            found = kernels[1](bag_vertices, owners, targets, len(self._post_order))
+        else:
+            found = _find_containing_numpy(bag_vertices, owners, targets, len(self._post_order))
+        if found >= 0:
+            return self._post_order[found]
 
     def remove(self, vertices):
         """Remove the vertices in `vertices` from all bags.
@@ -224,8 +337,13 @@ class TreeDecomposition(object):
         Returns:
             None
         """
-        for t in self:
-            self.tree.nodes[t]["bag"].vertices.difference_update(vertices)
+        if self.root is None:
+            self.set_root(1)
+        # only the bags that contain at least one of the vertices need to be updated
+        bag_vertices, owners = self._vertex_arrays()
+        hits = owners[np.isin(bag_vertices, np.fromiter(vertices, dtype = np.int64))]
+        for i in np.unique(hits).tolist():
+            self._bag_of[self._post_order[i]].vertices.difference_update(vertices)
                 
     def draw(self):
         """Visualizes this tree decompisition by showing a plot of it. 
@@ -236,7 +354,7 @@ class TreeDecomposition(object):
         """
         import matplotlib.pyplot as plt
         from networkx.drawing.nx_pydot import graphviz_layout
-        labels = { v : str((v, self.tree.nodes[v]["bag"])) for v in self.tree.nodes }
+        labels = { v : str((v, self._bag_of[v])) for v in self.tree.nodes }
         pos = graphviz_layout(self.tree, prog="dot")
         nx.draw(self.tree, pos)
         nx.draw_networkx_labels(self.tree, pos, labels)
@@ -248,6 +366,54 @@ class TreeDecomposition(object):
                 
 
 
+def _parse(data, names = None):
+    # parses a tree decomposition in the PACE format from `data` (bytes)
+    # if `names` is given, the vertex `v` in the bags is replaced by `names[v]`
+    bag_lines = []
+    edge_lines = []
+    for line in data.split(b"\n"):
+        line = line.lstrip()
+        head = line[:1]
+        if head == b"b":
+            bag_lines.append(line[1:])
+        elif head == b"s":
+            header = line.split()
+            bags = int(header[2])
+            width = int(header[3])
+            vertices = int(header[4])
+            tree = nx.Graph()
+            tree.add_nodes_from(range(1,bags + 1))
+        elif head != b"c" and head != b"":
+            edge_lines.append(line)
+    if len(bag_lines) > 0:
+        # parse the ids and vertices of all the bags at once and split them by counting the tokens on each line
+        bag_data = b"\n".join(bag_lines)
+        chars = np.frombuffer(bag_data, dtype = np.uint8)
+        space = (chars == ord(" ")) | (chars == ord("\t")) | (chars == ord("\r")) | (chars == ord("\n"))
+        starts = ~space
+        starts[1:] &= space[:-1]
+        counts = np.bincount(np.cumsum(chars == ord("\n"))[starts], minlength = len(bag_lines))
+        ends = np.cumsum(counts).tolist()
+        values = np.fromstring(bag_data, dtype = np.int64, sep = " ").tolist()
+        # creating many small sets triggers the cyclic garbage collector over and over, 
+        # although none of them can be part of a cycle, so we pause it while building them
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = 0
+            for end in ends:
+                if names is None:
+                    tree.nodes[values[start]]["bag"] = set(values[start + 1:end])
+                else:
+                    tree.nodes[values[start]]["bag"] = set([ names[v] for v in values[start + 1:end] ])
+                start = end
+        finally:
+            if enabled:
+                gc.enable()
+    if len(edge_lines) > 0:
+        tree.add_edges_from(np.fromstring(b"\n".join(edge_lines), dtype = np.int64, sep = " ").reshape(-1, 2).tolist())
+    return TreeDecomposition(bags, width, vertices, tree)
+
 def from_file(path):
     """Reads a tree decomposition from a file.
 
@@ -257,22 +423,8 @@ def from_file(path):
     Returns:
         :obj:`TreeDecomposition`: The tree decomposition specified in the file.
     """
-    with open(path, "r") as input:
-        for line in input:
-            line = line.split()
-            if len(line) == 0: 
-                continue
-            if line[0] == 's':
-                bags = int(line[2])
-                width = int(line[3])
-                vertices = int(line[4])
-                tree = nx.Graph()
-                tree.add_nodes_from(range(1,bags + 1))
-            elif line[0] == 'b':
-                tree.nodes[int(line[1])]["bag"] = set([ int(x) for x in line[2:] ])
-            else:
-                tree.add_edge(int(line[0]), int(line[1]))
-    return TreeDecomposition(bags, width, vertices, tree)
+    with open(path, "rb") as input:
+        return _parse(input.read())
 
 def from_stream(stream):
     """Reads a tree decomposition from a stream.
@@ -283,21 +435,7 @@ def from_stream(stream):
     Returns:
         :obj:`TreeDecomposition`: The tree decomposition specified in the stream.
     """
-    for line in stream.read().decode().split('\n'):
-        line = line.split()
-        if len(line) == 0: 
-            continue
-        if line[0] == 's':
-            bags = int(line[2])
-            width = int(line[3])
-            vertices = int(line[4])
-            tree = nx.Graph()
-            tree.add_nodes_from(range(1,bags + 1))
-        elif line[0] == 'b':
-            tree.nodes[int(line[1])]["bag"] = set([ int(x) for x in line[2:] ])
-        else:
-            tree.add_edge(int(line[0]), int(line[1]))
-    return TreeDecomposition(bags, width, vertices, tree)
+    return _parse(stream.read())
 
 def from_graph(graph, solver = "flow-cutter", timeout = "1"):
     """Constructs a tree decomposition from a graph.
@@ -312,13 +450,12 @@ def from_graph(graph, solver = "flow-cutter", timeout = "1"):
     """
     timeout = float(timeout)
     start = time.time()
-    node_map = dict()
-    map_node = dict()
-    idx = 1
-    for node in graph.nodes:
-        node_map[node] = idx
-        map_node[idx] = node
-        idx += 1
+    # the solver needs the vertices to be 1, ..., n, which they typically already are
+    if set(graph.nodes) == set(range(1, len(graph.nodes) + 1)):
+        map_node = None
+    else:
+        map_node = [ None ] + list(graph.nodes)
+        node_map = { node : idx for idx, node in enumerate(map_node) if idx > 0 }
     if solver == "flow-cutter":
         p = subprocess.Popen([os.path.join(src_path, "flow-cutter/flow_cutter_pace17")], stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds = True)
     else:
@@ -327,9 +464,12 @@ def from_graph(graph, solver = "flow-cutter", timeout = "1"):
     #    debug_gr.write(f"p tw {len(graph.nodes)} {len(graph.edges)}\n".encode())
     #    for (v,vp) in graph.edges:
     #        debug_gr.write(f"{node_map[v]} {node_map[vp]}\n".encode())
-    p.stdin.write(f"p tw {len(graph.nodes)} {len(graph.edges)}\n".encode())
-    for (v,vp) in graph.edges:
-        p.stdin.write(f"{node_map[v]} {node_map[vp]}\n".encode())
+    # write the whole instance at once with a single bytes formatting operation instead of one write per edge
+    if map_node is None:
+        edges = [ v for edge in graph.edges for v in edge ]
+    else:
+        edges = [ node_map[v] for edge in graph.edges for v in edge ]
+    p.stdin.write(b"p tw %d %d\n" % (len(graph.nodes), len(edges)//2) + (b"%d %d\n"*(len(edges)//2)) % tuple(edges))
     p.stdin.flush()
     p.stdin.close()
     first = False
@@ -341,25 +481,10 @@ def from_graph(graph, solver = "flow-cutter", timeout = "1"):
         p.wait(time_left)
     except subprocess.TimeoutExpired:
         p.terminate()
-    for line in p.stdout.read().decode().split('\n'):
-        line = line.split()
-        if len(line) == 0: 
-            continue
-        if line[0] == 's':
-            bags = int(line[2])
-            width = int(line[3])
-            vertices = int(line[4])
-            tree = nx.Graph()
-            tree.add_nodes_from(range(1,bags + 1))
-        elif line[0] == 'b':
-            tree.nodes[int(line[1])]["bag"] = set([ map_node[int(x)] for x in line[2:] ])
-        elif line[0] == 'c':
-            continue
-        else:
-            tree.add_edge(int(line[0]), int(line[1]))
+    td = _parse(p.stdout.read(), names = map_node)
     p.stdout.close()
     p.wait()
-    return TreeDecomposition(bags, width, vertices, tree)
+    return td
 
 def from_hypergraph(hypergraph, solver = "flow-cutter", timeout = "1"):
     """Constructs a tree decomposition from a hypergraph.
@@ -91,14 +91,10 @@ class MPEProblogProgram(AlgebraicProgram):
 
     def _finalize_cnf(self):
         weight_list = self.get_weights()
-        for v in range(self._cnf.nr_vars*2):
-            self._cnf.weights[to_dimacs(v)] = weight_list[v]
+        self._cnf.weights.update(zip(to_dimacs_array(self._cnf.nr_vars*2).tolist(), weight_list))
         self._cnf.semirings = [ self.semiring ]
         self._cnf.quantified = [ list(range(1, self._cnf.nr_vars + 1)) ]
-        query_cnt = max(len(self.queries), 1)
-        for v in self._deriv:
-            if all(self._cnf.weights[v][i] == self.semiring.one() and self._cnf.weights[-v][i] == self.semiring.one() for i in range(query_cnt)):
-                self._cnf.auxilliary.add(v)
+        self._cnf.auxilliary.update(self._cnf.get_non_contributing_vars(self._deriv))
 
     def get_weights(self):
         query_cnt = 1
@@ -468,16 +468,14 @@ class Program(object):
                     if vp not in edges:
                         edges[vp] = set()
                     edges[vp].add(v)
-        graph = ""
-        for v in edges.keys():
-            for vp in edges[v]:
-                graph += f"{v} {vp}\n"
+        # build the input as bytes in one go instead of repeatedly concatenating strings
+        graph = b"".join(b"%d %d\n" % (v, vp) for v in edges.keys() for vp in edges[v])
         if not approximate:
             q = subprocess.Popen([os.path.join(src_path, "fvs/src/build/FeedbackVertexSet")], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            output, err = q.communicate(input=graph.encode(), timeout = float(config.config["backdoort"]))
+            output, err = q.communicate(input=graph, timeout = float(config.config["backdoort"]))
         else:
             q = subprocess.Popen([os.path.join(src_path, "fvs/src/build/FeedbackVertexSet"), "Appx"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-            output, err = q.communicate(input=graph.encode())
+            output, err = q.communicate(input=graph)
         res = [ int(v) for v in output.decode().split()[1:] ]
         return res
 
@@ -1067,8 +1065,7 @@ class Program(object):
         if not latest:
             seen = set()
             facts = set([ r.head[0] for r in self._program if len(r.body) == 0 ])
-            for f in facts:
-                self._cnf.clauses.append([f])
+            self._cnf.clauses.extend([f] for f in facts)
             seen.update(facts)
         
         if not latest:
@@ -1088,8 +1085,7 @@ class Program(object):
         if not latest:
             # handle the atoms that do not occur in the head of any rule
             falses = [ a for a in self._deriv if a not in seen and nodes[a][0] == OR and len(nodes[a][1]) == 0 ]
-            for f in falses:
-                self._cnf.clauses.append([-f])
+            self._cnf.clauses.extend([-f] for f in falses)
 
         # set up the and/or graph
         graph = nx.Graph()
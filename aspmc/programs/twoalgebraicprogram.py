@@ -60,8 +60,7 @@ class TwoAlgebraicProgram(Program):
         first = set([ int(str(varMap[name])) for (name, _) in self.first_weights ])
         second = set([ int(str(varMap[name])) for (name, _) in self.second_weights ])
         self._cnf.quantified = [first, second]
-        for v in range(self._cnf.nr_vars*2):
-            self._cnf.weights[to_dimacs(v)] = weight_list[v]
+        self._cnf.weights.update(zip(to_dimacs_array(self._cnf.nr_vars*2).tolist(), weight_list))
         self._cnf.transform = self.transform
         self._cnf.semirings = [ self.first_semiring, self.second_semiring ]
         # TODO figure out which variables we can mark as auxilliary
@@ -19,6 +19,7 @@ src_path = os.path.realpath(os.path.join(src_path, '../external'))
 import aspmc.graph.treedecomposition as treedecomposition
 from aspmc.graph.hypergraph import Hypergraph
 from aspmc.compile.cnf import CNF
+from aspmc.util import format_clauses
 
 
 logger = logging.getLogger("twstats")
@@ -191,8 +192,7 @@ class Circuit(object):
                     check.add(child)
         
         stream.write(f"p tw {idx} {len(edges)}\n".encode())
-        for e in edges:
-            stream.write(f"{e[0]} {e[1]}\n".encode())
+        stream.write(b"".join(b"%d %d\n" % e for e in edges))
 
     def to_cnf(self, stream):
         name_map = {}
@@ -233,8 +233,7 @@ class Circuit(object):
                     check.add(child)
         
         stream.write(f"p cnf {idx-1} {len(clauses)}\n".encode())
-        for c in clauses:
-            stream.write((" ".join([str(v) for v in c]) + " 0\n").encode())
+        stream.write(format_clauses(clauses))
 
 
     def td_guided_to_cnf(self):
@@ -1,3 +1,5 @@
+import numpy as np
+
 def to_dimacs(var):
     idx = var//2 + 1
     if var % 2 == 1:
@@ -14,4 +16,25 @@ def neg(var, dimacs = False):
     if dimacs:
         return -var
     else:
-        return var ^ 1
\ No newline at end of file
+        return var ^ 1
+
+def to_dimacs_array(nr_lits):
+    idx = np.arange(nr_lits)//2 + 1
+    idx[1::2] *= -1
+    return idx
+
+def to_pos_array(lits):
+    lits = np.asarray(lits)
+    return 2*(np.abs(lits) - 1) + (lits < 0)
+
+def format_clauses(clauses, prefix = b""):
+    # formats every clause with a single bytes formatting operation instead of one str() call per literal
+    # the format only depends on the length of the clause, so it is shared by all clauses of the same length
+    formats = {}
+    lines = []
+    for clause in clauses:
+        fmt = formats.get(len(clause))
+        if fmt is None:
+            fmt = formats[len(clause)] = prefix + b"%d " * len(clause) + b"0\n"
+        lines.append(fmt % tuple(clause))
+    return b"".join(lines)
@@ -1,5 +1,10 @@
 import importlib
+import io
+import itertools
+import os
+import random
 import unittest
+from unittest import mock
 import numpy as np
 
 
@@ -10,11 +15,39 @@ import aspmc.config as config
 config.config["decos"] = "flow-cutter"
 config.config["decot"] = "-1"
 
+import aspmc.signal_handling as my_signals
+import aspmc.compile.cnf as cnf_module
 from aspmc.compile.cnf import CNF
 
 compilers_single = ["c2d", "miniC2D", "sharpsat-td", "sharpsat-td-live", "d4"]
 compilers_two = ["c2d", "miniC2D"]
 
+class FakeMinisat(object):
+    # stands in for the minisat process of `CNF.is_sat`, records the cnfs it is handed and decides them by brute force
+    inputs = []
+
+    def __init__(self, args, **kwargs):
+        self.stdin = io.BytesIO()
+        self.stdin.close = self.solve
+        self.stdout = io.BytesIO()
+
+    def solve(self):
+        data = self.stdin.getvalue()
+        FakeMinisat.inputs.append(data)
+        cnf = CNF(string = data.decode())
+        assignments = itertools.product([ False, True ], repeat = cnf.nr_vars)
+        sat = any(all(any((l > 0) == signs[abs(l) - 1] for l in c) for c in cnf.clauses) for signs in assignments)
+        self.stdout = io.BytesIO(b"SATISFIABLE\n" if sat else b"UNSATISFIABLE\n")
+
+    def wait(self):
+        return 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
 class TestCNFSpecial(unittest.TestCase):
     def test_empty(self):
         cnf = CNF()
@@ -115,5 +148,125 @@ class TestCNFSpecial(unittest.TestCase):
             except:
                 self.assertTrue(False)
 
+    def test_is_sat_in_place_edit(self):
+        cnf = CNF()
+        cnf.nr_vars = 1
+        cnf.clauses = [[1], [1]]
+        FakeMinisat.inputs = []
+        with mock.patch("subprocess.Popen", FakeMinisat):
+            self.assertTrue(cnf.is_sat())
+            self.assertTrue(cnf.is_sat())
+            self.assertEqual(len(FakeMinisat.inputs), 1)
+            cnf.clauses[1] = [-1]
+            self.assertFalse(cnf.is_sat())
+            self.assertEqual(FakeMinisat.inputs[-1], b"p cnf 1 2\n1 0\n-1 0\n")
+
+    def test_remove_trivial_clauses(self):
+        cnf = CNF()
+        cnf.nr_vars = 3
+        cnf.clauses = [[1, 2, -1], [1, 2, 3], [-3, 2, 3], [2, -2], [-1, -2]]
+        cnf.remove_trivial_clauses()
+        self.assertEqual(cnf.clauses, [[1, 2, 3], [-1, -2]])
+
+    def test_remove_duplicate_clauses(self):
+        cnf = CNF()
+        cnf.nr_vars = 3
+        cnf.clauses = [[1, 2], [2, 1], [1, 2, 3], [-3], [2, 1, 1], [-3]]
+        cnf.remove_duplicate_clauses()
+        self.assertEqual(cnf.clauses, [[1, 2], [1, 2, 3], [-3]])
+
+    def test_get_weights_replaced(self):
+        cnf = CNF(string = "p cnf 1 0\nc p weight 1 0.3 0\nc p weight -1 0.7 0\n")
+        self.assertEqual(cnf.get_weights()[0][0][0], 0.3)
+        cnf.weights[1] = np.array([0.4])
+        self.assertEqual(cnf.get_weights()[0][0][0], 0.4)
+        cnf.weights = { 1 : np.array([0.5]), -1 : np.array([0.5]) }
+        self.assertEqual(cnf.get_weights()[0][0][0], 0.5)
+
+    def test_evaluate_trivial_repeated(self):
+        cnf = CNF()
+        cnf.nr_vars = 3
+        results = cnf.evaluate_trivial()
+        self.assertEqual(results[0], 2**3)
+        results[0] = 0
+        self.assertEqual(cnf.evaluate_trivial()[0], 2**3)
+        cnf.nr_vars = 4
+        self.assertEqual(cnf.evaluate_trivial()[0], 2**4)
+
+    def test_from_bytes(self):
+        data = b"p cnf 3 2\n1 -2 0\nc p weight 1 0.3 0\nc p weight -1 0.7 0\n2 3 0\n"
+        cnf = CNF.from_bytes(data)
+        self.assertEqual(cnf.nr_vars, 3)
+        self.assertEqual(cnf.clauses, [[1, -2], [2, 3]])
+        self.assertEqual(str(cnf), str(CNF(string = data.decode())))
+
+    def test_write_loaded_clauses(self):
+        cnf = CNF.from_bytes(b"p cnf 3 2\n1  -2 0\n2 3 0\n")
+        stream = io.BytesIO()
+        cnf.to_stream(stream)
+        self.assertEqual(stream.getvalue(), b"p cnf 3 2\n1 -2 0\n2 3 0\n")
+        cnf.clauses[0] = [1, 2]
+        stream = io.BytesIO()
+        cnf.to_stream(stream)
+        self.assertEqual(stream.getvalue(), b"p cnf 3 2\n1 2 0\n2 3 0\n")
+        cnf.clauses[0][1] = -2
+        cnf.clauses.append([-3])
+        stream = io.BytesIO()
+        cnf.to_stream(stream)
+        self.assertEqual(stream.getvalue(), b"p cnf 3 3\n1 -2 0\n2 3 0\n-3 0\n")
+
+    def test_evaluate_batch(self):
+        cnfs = []
+        for nr_vars in range(1, 4):
+            cnf = CNF()
+            cnf.nr_vars = nr_vars
+            cnfs.append(cnf)
+        results = CNF.evaluate_batch(cnfs, strategy = "compilation", max_workers = 2)
+        self.assertEqual([ r[0] for r in results ], [ 2, 4, 8 ])
+        self.assertEqual(CNF.evaluate_batch([]), [])
+
+    @unittest.skipUnless(os.path.isfile(cnf_module.uwrmaxsat_path) and os.path.isfile(cnf_module.minisat_path), "the MaxSAT and SAT solvers are not built")
+    def test_evaluate_batch_maxsat(self):
+        # SAT instances (all weights zero) and MaxSAT instances, each checked against brute force
+        rng = random.Random(0)
+        cnfs = []
+        expected = []
+        for i in range(40):
+            nr_vars = 3
+            clauses = [ [ rng.choice([-1, 1])*rng.randint(1, nr_vars) for _ in range(rng.randint(1, 2)) ] for _ in range(3) ]
+            choices = [ 0.0 ] if i % 2 == 0 else [ 0.0, 1.0, -1.5, 2.25 ]
+            weights = { l : rng.choice(choices) for v in range(1, nr_vars + 1) for l in (v, -v) }
+            lines = [ f"p cnf {nr_vars} {len(clauses)}" ] + [ " ".join(map(str, c)) + " 0" for c in clauses ]
+            lines += [ f"c p weight {l} {w} 0" for l, w in weights.items() ]
+            lines += [ "c p semirings aspmc.semirings.maxplus 0", f"c p quantify {' '.join(map(str, range(1, nr_vars + 1)))} 0" ]
+            cnfs.append(CNF(string = "\n".join(lines)))
+            best = float("-inf")
+            for signs in itertools.product([-1, 1], repeat = nr_vars):
+                assignment = { s*v for s, v in zip(signs, range(1, nr_vars + 1)) }
+                if all(any(l in assignment for l in c) for c in clauses):
+                    best = max(best, sum(weights[l] for l in assignment))
+            expected.append(best)
+        tempfiles = set(my_signals.tempfiles)
+        kept = dict(cnf_module._kept_tempfiles)
+        results = CNF.evaluate_batch(cnfs, max_workers = 4)
+        self.assertEqual([ r[0].value for r in results ], expected)
+        self.assertEqual(my_signals.tempfiles, tempfiles)
+        self.assertEqual(cnf_module._kept_tempfiles, kept)
+
+    def test_batch_worker_tempfiles(self):
+        # the worker processes of evaluate_batch are stopped without running the exit handlers, 
+        # so they must not keep any tempfiles after using them
+        kept = dict(cnf_module._kept_tempfiles)
+        try:
+            cnf_module._init_batch_worker()
+            with cnf_module._pooled_tempfile("test") as path:
+                self.assertIn(path, my_signals.tempfiles)
+            self.assertFalse(os.path.exists(path))
+            self.assertNotIn(path, my_signals.tempfiles)
+            self.assertEqual(cnf_module._kept_tempfiles, {})
+        finally:
+            cnf_module._pool_tempfiles = True
+            cnf_module._kept_tempfiles.update(kept)
+
 if __name__ == '__main__':
     unittest.main(buffer=True)